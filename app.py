@@ -1,39 +1,130 @@
 
 import os
 import io
+import sys
+import json
+import time
+import uuid
 import base64
+import shutil
+import hashlib
+import sqlite3
+import logging
 import datetime
+import importlib.util
+import tempfile
+import threading
+import functools
+import tracemalloc
+import multiprocessing
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime as dt
 from pathlib import Path
 
 import pandas as pd
 import numpy as np
+from pandas.api.types import union_categoricals
 import streamlit as st
-import plotly.express as px
-import plotly.graph_objects as go
-from fpdf import FPDF
+import schedule
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-@st.cache_data
-def load_excel_file(file_path):
-    try:
-        df = pd.read_excel(file_path)
-        return df
-    except Exception as e:
-        st.error(f"Error loading {file_path}: {e}")
-        return pd.DataFrame()
+logger = logging.getLogger(__name__)
+
+# Filtered trip frames are slices of the cached table; copy-on-write (always on from pandas 3)
+# keeps them from copying until something writes to them
+if int(pd.__version__.split(".")[0]) == 2:
+    pd.set_option("mode.copy_on_write", True)
+
+try:
+    import pyarrow  # noqa: F401  (enables the on-disk parquet cache)
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+try:
+    import fcntl  # cross-process lock around cache rebuilds, POSIX only
+except ImportError:
+    fcntl = None
+
+# Optional UNION_BACKEND=duckdb; only imported when a DuckDB trip store is opened
+HAS_DUCKDB = importlib.util.find_spec("duckdb") is not None
+
 # Files expected
 FILES = {
-    "passengers":r"./PASSENGERS.xlsx",
-    "drivers":r" ./DRIVERS.xlsx",
-    "beer": r"./BEER.xlsx",
-    "transactions": r"./TRANSACTIONS.xlsx",
-    "union_staff": r"./UNION STAFF.xlsx",
+    "passengers": Path("./PASSENGERS.xlsx"),
+    "drivers": Path("./DRIVERS.xlsx"),
+    "beer": Path("./BEER.xlsx"),
+    "transactions": Path("./TRANSACTIONS.xlsx"),
+    "union_staff": Path("./UNION STAFF.xlsx"),
 }
 
+LOGO_PATH = Path("./TUTU.png")
+
+# Cleaned tables are cached as parquet next to a manifest of the FILES they were built from
+CACHE_DIR = Path(os.getenv("UNION_CACHE_DIR", "./.cache"))
+CACHE_MANIFEST = CACHE_DIR / "manifest.json"
+# Bump when preprocess_data changes the shape of the cleaned tables
+CACHE_SCHEMA_VERSION = 6
+# Where trip selections are read from: "pandas" keeps the trips table in memory in every server process,
+# "sqlite" or "duckdb" store it once under CACHE_DIR and query each selection from there
+TRIP_BACKEND = os.getenv("UNION_BACKEND", "pandas").lower()
+# When BEER.xlsx and TRANSACTIONS.xlsx only grew, clean just the appended trips and re-join the trips the new
+# payments are for (UNION_INCREMENTAL=0 always rebuilds)
+INCREMENTAL_INGEST = os.getenv("UNION_INCREMENTAL", "1") != "0"
+TABLE_SOURCES = {
+    "passengers": ["passengers"],
+    "drivers": ["drivers"],
+    "beer": ["beer", "transactions"],
+    "union_staff": ["union_staff"],
+}
+# Tables derived from cleaned (or earlier derived) tables, cached with the sources of all of them
+DERIVED_TABLES = {
+    "daily_rollup": ["beer"],
+    "staff_index": ["beer", "union_staff"],
+    "staff_trips": ["beer", "staff_index"],
+    "entity_activity": ["beer"],
+    "user_cohorts": ["entity_activity", "drivers", "passengers"],
+    "location_activity": ["beer"],
+}
+# Rows converted per step when writing exports
+EXPORT_CHUNK_ROWS = 50_000
+# Prepared Excel/PDF reports kept per session (one per report and filter selection)
+EXPORT_MEMO_ENTRIES = 8
+# Bounds of the KPI result cache shared by all sessions
+KPI_CACHE_ENTRIES = int(os.getenv("UNION_KPI_CACHE_ENTRIES", "256"))
+KPI_CACHE_BYTES = int(os.getenv("UNION_KPI_CACHE_MB", "128")) * 1024 * 1024
+# Worker processes for month-partitioned KPI aggregation (1 = serial, 0 = one per CPU) and the
+# smallest filtered selection worth forking for. The pools fork the Streamlit server, which runs every
+# session (and the refresher) on its own thread: a child only gets the forking thread, and a lock another
+# thread held at that moment (logging, a C library's allocator) stays held in it, so a worker can hang.
+# Off by default; use it where selections are large and the server is lightly loaded.
+KPI_WORKERS = int(os.getenv("UNION_KPI_WORKERS", "1")) or os.cpu_count()
+PARALLEL_MIN_ROWS = int(os.getenv("UNION_KPI_PARALLEL_MIN_ROWS", "500000"))
+# Most points any one chart sends to the browser; longer series are downsampled with LTTB
+MAX_CHART_POINTS = int(os.getenv("UNION_MAX_CHART_POINTS", "1000"))
+TRIPS_PER_DRIVER_BINS = 30
+# Optional CSV with Town and Zone columns grouping the towns of trip addresses into larger zones; applied
+# when the location dimension is built, so clear the cache after editing it
+LOCATION_ZONES_FILE = os.getenv("UNION_LOCATION_ZONES")
+# Busiest zones shown each way in the origin-destination heatmap; the rest are summed into "Other"
+OD_MATRIX_SIZE = int(os.getenv("UNION_OD_MATRIX_SIZE", "15"))
+# Per-stage timings (UNION_PERF=1), optionally appended to a JSON-lines file (UNION_PERF_LOG)
+PERF_ENABLED = os.getenv("UNION_PERF", "0") == "1"
+PERF_LOG = os.getenv("UNION_PERF_LOG")
+# KPI cache stats and its "Clear" button in the sidebar (UNION_KPI_ADMIN=1); the cache is shared by every
+# session, so it is off for ordinary viewers
+KPI_ADMIN_ENABLED = os.getenv("UNION_KPI_ADMIN", "0") == "1"
+# How often the background refresher checks FILES for changes
+REFRESH_INTERVAL_SECONDS = int(os.getenv("UNION_REFRESH_SECONDS", "60"))
+# Compute the default view's KPIs into the KPI cache when the data is loaded and after every refresh
+WARM_UP = os.getenv("UNION_WARM_UP", "1") != "0"
+
 # Theme CSS
 LIGHT_THEME_CSS = """
 <style>
@@ -67,22 +158,130 @@ DARK_THEME_CSS = """
 </style>
 """
 
+# Performance instrumentation. With UNION_PERF unset, perf_stage does nothing and @instrumented returns
+# the function untouched, so the hot paths pay nothing.
+# Timings are per thread, but tracemalloc traces the whole process with a single peak counter, so peak
+# memory is measured for one run at a time: a run that starts while another is traced records
+# peak_mb None. Allocations other threads make during the traced run still count towards its peaks.
+# Tracing stops when the run finishes, so the other sessions only slow down while it lasts.
+_perf = threading.local()
+_perf_memory_lock = threading.Lock()
+_perf_memory_owner = None
+
+def perf_claim_memory():
+    # The thread whose run is traced; taken over from a run that ended without perf_finish_run (its
+    # thread is gone, e.g. a rerun interrupted by the next one)
+    global _perf_memory_owner
+    with _perf_memory_lock:
+        owner = _perf_memory_owner
+        if owner is not None and owner is not threading.current_thread() and owner.is_alive():
+            return False
+        _perf_memory_owner = threading.current_thread()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return True
+
+def perf_release_memory():
+    global _perf_memory_owner
+    with _perf_memory_lock:
+        if _perf_memory_owner is threading.current_thread():
+            _perf_memory_owner = None
+            tracemalloc.stop()
+
+def perf_start_run(label):
+    # Start collecting the stages of one rerun (or one background refresh) on this thread
+    if not PERF_ENABLED:
+        return
+    _perf.memory = perf_claim_memory()
+    _perf.run = f"{label}@{dt.now().isoformat(timespec='milliseconds')}"
+    _perf.records = []
+    _perf.stack = []
+
+def perf_records():
+    return list(getattr(_perf, "records", []))
+
+@contextmanager
+def perf_stage(name, rows=None):
+    # Records wall time, rows and peak traced memory of the block; callers may fill record["rows"] later
+    if not PERF_ENABLED or getattr(_perf, "records", None) is None:
+        yield {}
+        return
+    memory = _perf.memory
+    # tracemalloc has a single peak counter: fold it into the enclosing stage before resetting it
+    current, peak = tracemalloc.get_traced_memory() if memory else (0, 0)
+    if _perf.stack:
+        _perf.stack[-1]["peak"] = max(_perf.stack[-1]["peak"], peak)
+    if memory:
+        tracemalloc.reset_peak()
+    frame = {"start": current, "peak": current}
+    _perf.stack.append(frame)
+    record = {"run": _perf.run, "stage": name, "depth": len(_perf.stack) - 1, "rows": rows}
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = round(time.perf_counter() - started, 6)
+        peak = max(frame["peak"], tracemalloc.get_traced_memory()[1] if memory else 0)
+        record["peak_mb"] = round((peak - frame["start"]) / 1024 / 1024, 3) if memory else None
+        _perf.stack.pop()
+        if _perf.stack:
+            _perf.stack[-1]["peak"] = max(_perf.stack[-1]["peak"], peak)
+        _perf.records.append(record)
+
+def frame_rows(args, kwargs, result):
+    # Rows processed: the first frame passed in, otherwise the frame returned
+    for value in (kwargs.get("filtered_df"), *args, *kwargs.values(), result):
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return len(value)
+    return None
+
+def instrumented(name=None):
+    def decorate(func):
+        if not PERF_ENABLED:
+            return func
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with perf_stage(name or func.__name__) as record:
+                result = func(*args, **kwargs)
+                record["rows"] = frame_rows(args, kwargs, result)
+            return result
+        return wrapper
+    return decorate
+
+def perf_jsonl(records):
+    return "".join(json.dumps(record, default=str) + "\n" for record in records)
+
+def perf_finish_run():
+    records = perf_records()
+    if records and PERF_LOG:
+        with open(PERF_LOG, "a") as f:
+            f.write(perf_jsonl(records))
+    _perf.records = None
+    if getattr(_perf, "memory", False):
+        _perf.memory = False
+        perf_release_memory()
+    return records
+
 # Utility functions for cleaning
-def clean_ugx_amount(series):
+def clean_ugx_amount(series, report=None, name=None):
     # Remove 'UGX', commas, whitespace, convert to float, handle negatives, default 0.0
-    def clean_value(x):
-        if pd.isna(x):
-            return 0.0
-        if isinstance(x, (int, float)):
-            return float(x)
-        try:
-            s = str(x).replace("UGX", "").replace(",", "").strip()
-            if s == "":
-                return 0.0
-            return float(s)
-        except Exception:
-            return 0.0
-    return series.apply(clean_value)
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        # Already numeric (read_excel parsed it), no string pass needed
+        values = series.astype(float)
+        missing = int(series.isna().sum())
+    else:
+        # Amounts repeat heavily, so parse each distinct raw value once and broadcast back by code
+        codes, uniques = pd.factorize(series)
+        text = (pd.Series(np.asarray(uniques, dtype=object)).astype(str)
+                .str.replace("UGX", "", regex=False)
+                .str.replace(",", "", regex=False)
+                .str.strip())
+        parsed = np.append(pd.to_numeric(text, errors="coerce").to_numpy(dtype=float), np.nan)
+        values = pd.Series(parsed[codes], index=series.index, name=series.name)
+        missing = int((codes < 0).sum())
+    if report is not None:
+        report[name] = {"coerced_to_zero": int(values.isna().sum()), "missing": missing}
+    return values.fillna(0.0)
 
 def clean_date(series):
     return pd.to_datetime(series, errors='coerce')
@@ -93,7 +292,7 @@ def clean_distance(series):
 def fill_pay_mode(series):
     return series.fillna("Unknown")
 
-@st.cache_data(show_spinner=True)
+@instrumented()
 def load_excel_file(filepath):
     if not filepath.exists():
         st.error(f"Data file not found: {filepath.name}. Please ensure the Excel file is placed in the data/ directory.")
@@ -105,63 +304,1268 @@ def load_excel_file(filepath):
         st.error(f"Error loading {filepath.name}: {e}")
         return None
 
-@st.cache_data(show_spinner=True)
+# Parquet cache of the cleaned tables
+_cache_thread_lock = threading.Lock()
+
+def file_fingerprint(filepath):
+    try:
+        stat = filepath.stat()
+    except OSError:
+        return None
+    return {"path": str(filepath.resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def read_cache_manifest():
+    try:
+        with open(CACHE_MANIFEST) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    if manifest.get("schema") != CACHE_SCHEMA_VERSION:
+        return {"schema": CACHE_SCHEMA_VERSION, "tables": {}}
+    return manifest
+
+def atomic_write(path, write):
+    # write(tmp_path) fills a temp file of this writer's own next to path, which then replaces path:
+    # concurrent writers never share a temp file and readers see either the old file or the new one.
+    # The leading dot keeps half-written parts out of the parquet directory reads.
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+def write_cache_manifest(manifest):
+    atomic_write(CACHE_MANIFEST, lambda tmp_path: Path(tmp_path).write_text(json.dumps(manifest, indent=2)))
+
+@contextmanager
+def cache_lock():
+    # One loader at a time across the threads and processes sharing CACHE_DIR (several server processes,
+    # batch runs, the refresher): the next one re-reads the manifest and finds the tables already rebuilt
+    # instead of rebuilding them over each other. Without fcntl (Windows) only threads are serialized.
+    with _cache_thread_lock:
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            lock_file = open(CACHE_DIR / "cache.lock", "a")
+        except OSError:
+            # Read-only cache directory: nothing gets written, nothing to serialize
+            yield
+            return
+        with lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+def _parquet_safe(df):
+    # pyarrow rejects object columns mixing text and numbers (e.g. Phone), store those as text. Also applied
+    # by preprocess_data, so a fresh load returns the same dtypes and values as one read back from the cache
+    mixed = [col for col in df.columns if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith("mixed")]
+    if not mixed:
+        return df
+    return df.assign(**{col: df[col].where(df[col].isna(), df[col].astype(str)).astype("str") for col in mixed})
+
+def source_files(name):
+    if name not in DERIVED_TABLES:
+        return TABLE_SOURCES[name]
+    return list(dict.fromkeys(source for base in DERIVED_TABLES[name] for source in source_files(base)))
+
+def table_sources(name, fingerprints):
+    return [fingerprints[source] for source in source_files(name)]
+
+# Each table is a directory of parquet parts: a rebuild writes part-00000, incremental refreshes add parts
+def read_table_parts(name):
+    try:
+        df = pd.read_parquet(CACHE_DIR / name, memory_map=True)
+    except Exception:
+        return None
+    # Parquet loses the text categories of an all-empty categorical column (e.g. Pickup Location)
+    empty = [col for col in df.columns.intersection(CATEGORICAL_COLUMNS) if not df[col].notna().any()]
+    return df.assign(**{col: df[col].astype("str").astype("category") for col in empty}) if empty else df
+
+def read_cached_table(name, manifest, fingerprints):
+    entry = manifest.get("tables", {}).get(name)
+    if entry is None or entry["sources"] != table_sources(name, fingerprints):
+        return None
+    return read_table_parts(name)
+
+def write_table_part(name, df, part):
+    table_dir = CACHE_DIR / name
+    table_dir.mkdir(parents=True, exist_ok=True)
+    atomic_write(table_dir / f"part-{part:05d}.parquet", lambda tmp_path: _parquet_safe(df).to_parquet(tmp_path, index=False))
+
+def write_cached_table(name, df):
+    table_dir = CACHE_DIR / name
+    for old_part in table_dir.glob("part-*.parquet"):
+        if old_part.name != "part-00000.parquet":
+            old_part.unlink()
+    write_table_part(name, df, 0)
+
+def cache_table(name, df, manifest, fingerprints):
+    if not HAS_PYARROW or df is None:
+        return
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        write_cached_table(name, df)
+        manifest["tables"][name] = {"sources": table_sources(name, fingerprints)}
+    except Exception as e:
+        st.warning(f"Could not cache {name}: {e}")
+
+@instrumented()
 def load_all_data():
-    passengers = load_excel_file(FILES["passengers"])
-    drivers = load_excel_file(FILES["drivers"])
-    beer = load_excel_file(FILES["beer"])
-    transactions = load_excel_file(FILES["transactions"])
-    union_staff = load_excel_file(FILES["union_staff"])
-    return passengers, drivers, beer, transactions, union_staff
-
-def preprocess_data(passengers, drivers, beer, transactions, union_staff):
+    if not HAS_PYARROW:
+        return load_tables()
+    with cache_lock():
+        return load_tables()
+
+def load_tables():
+    fingerprints = {name: file_fingerprint(path) for name, path in FILES.items()}
+    manifest = read_cache_manifest() if HAS_PYARROW else {"schema": CACHE_SCHEMA_VERSION, "tables": {}}
+    tables = {name: read_cached_table(name, manifest, fingerprints) for name in TABLE_SOURCES} if HAS_PYARROW else dict.fromkeys(TABLE_SOURCES)
+    stale = [name for name, df in tables.items() if df is None]
+    changed = bool(stale)
+    if "beer" in stale and INCREMENTAL_INGEST and HAS_PYARROW:
+        appended = append_new_trips(manifest, fingerprints)
+        if appended is not None:
+            tables["beer"] = appended
+            stale.remove("beer")
+    if stale:
+        # Only parse and clean the workbooks behind tables whose sources changed
+        raw = {source: load_excel_file(FILES[source]) for name in stale for source in TABLE_SOURCES[name]}
+        # Taken before preprocess_data cleans the payments in place
+        payments_mark = payments_high_water_mark(raw["transactions"]) if raw.get("transactions") is not None else None
+        reports = {}
+        passengers, drivers, beer, union_staff_names = preprocess_data(
+            raw.get("passengers"), raw.get("drivers"), raw.get("beer"), raw.get("transactions"), raw.get("union_staff"),
+            report=reports)
+        for key, value in reports.items():
+            manifest.setdefault("reports", {}).setdefault(key, {}).update(value)
+        cleaned = {
+            "passengers": passengers,
+            "drivers": drivers,
+            "beer": beer,
+            "union_staff": pd.DataFrame({"Union Staff": union_staff_names}) if raw.get("union_staff") is not None else None,
+        }
+        for name in stale:
+            tables[name] = cleaned[name]
+            cache_table(name, cleaned[name], manifest, fingerprints)
+        if "beer" in stale and "beer" in manifest["tables"]:
+            manifest["tables"]["beer"]["high_water_mark"] = trips_high_water_mark(raw["beer"], beer)
+            manifest["tables"]["beer"]["payments_high_water_mark"] = payments_mark
+        if "beer" in stale:
+            # The last refresh was a full rebuild, not an incremental one
+            manifest.setdefault("reports", {}).pop("incremental", None)
+    # Derived tables are rebuilt from the cleaned table whenever it was rebuilt
+    for name, bases in DERIVED_TABLES.items():
+        derived = None
+        if HAS_PYARROW and not set(bases) & set(stale):
+            derived = read_cached_table(name, manifest, fingerprints)
+        if derived is None and tables[bases[0]] is not None:
+            derived = DERIVED_BUILDERS[name](*(tables[base] for base in bases))
+            stale.append(name)
+            changed |= derived is not None
+            cache_table(name, derived, manifest, fingerprints)
+        tables[name] = derived
+    if changed and HAS_PYARROW and CACHE_DIR.exists():
+        write_cache_manifest(manifest)
+    union_staff = tables["union_staff"]
+    union_staff_names = union_staff["Union Staff"].tolist() if union_staff is not None else []
+    return (tables["passengers"], tables["drivers"], tables["beer"], union_staff_names, tables["daily_rollup"],
+            tables["staff_index"], tables["staff_trips"], tables["entity_activity"], tables["user_cohorts"],
+            tables["location_activity"], manifest.get("reports", {}))
+
+# Immutable snapshot of the cleaned data. Reruns hold on to the snapshot they started with, the
+# refresher builds the next one off the request path and swaps it in.
+@dataclass(frozen=True)
+class DataSnapshot:
+    version: int
+    loaded_at: dt
+    fingerprints: dict
+    passengers: pd.DataFrame
+    drivers: pd.DataFrame
+    beer: pd.DataFrame
+    union_staff_names: list
+    daily_rollup: pd.DataFrame
+    staff_index: pd.DataFrame
+    staff_trips: pd.DataFrame
+    entity_activity: pd.DataFrame
+    user_cohorts: pd.DataFrame
+    location_activity: pd.DataFrame
+    reports: dict
+    # Set instead of beer when TRIP_BACKEND is "sqlite" or "duckdb"
+    trip_store: object = None
+
+# On-disk trip store: the cleaned trips in one SQLite or DuckDB file under CACHE_DIR, shared by every
+# server process and batch worker. Each version of the BEER/TRANSACTIONS sources gets its own file, so
+# reruns still holding the previous snapshot keep reading the previous file; selections are indexed
+# range queries and the daily export is aggregated by the database. A file is deleted once it has been
+# superseded for TRIP_STORE_GRACE_SECONDS, long enough for every server process sharing CACHE_DIR to have
+# refreshed onto a newer snapshot.
+TRIP_STORE_INDEXES = [["Trip Date"], ["Trip Status", "Trip Date"], ["Driver"]]
+TRIP_STORE_GRACE_SECONDS = int(os.getenv("UNION_TRIP_STORE_GRACE_SECONDS", "3600"))
+NS_PER_DAY = 86_400 * 10**9
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+class TripStore:
+    def __init__(self, path, engine, meta):
+        self.path = path
+        self.engine = engine
+        self.meta = meta
+        self.columns = list(meta["dtypes"])
+        self.min_date = pd.Timestamp(meta["min_date"])
+        self.max_date = pd.Timestamp(meta["max_date"])
+        self.statuses = meta["statuses"]
+        self.rows = meta["rows"]
+
+    @classmethod
+    def open(cls, beer, sources, engine=None):
+        # Reuses the file when it was built from the same sources. Otherwise, when beer only grew since the
+        # newest file (an incremental refresh), that file is copied and the new trips appended; else the
+        # file is written from beer. Under cache_lock, so processes sharing CACHE_DIR build it only once.
+        engine = engine or ("duckdb" if TRIP_BACKEND == "duckdb" and HAS_DUCKDB else "sqlite")
+        if engine == "sqlite" and TRIP_BACKEND == "duckdb":
+            logger.warning("UNION_BACKEND=duckdb but duckdb is not installed, using sqlite")
+        digest = hashlib.sha1(json.dumps(sources, sort_keys=True).encode()).hexdigest()[:12]
+        path = CACHE_DIR / f"trips-{digest}.{engine}"
+        with cache_lock():
+            meta = cls.read_meta(path, engine)
+            if meta is None or meta["sources"] != sources:
+                previous = cls.stores(engine)
+                meta = cls.write(path, engine, beer, sources, previous[-1] if previous else None)
+                cls.remove_superseded(engine)
+        return cls(path, engine, meta)
+
+    @staticmethod
+    def stores(engine):
+        # Store files of an engine, oldest first
+        return sorted(CACHE_DIR.glob(f"trips-*.{engine}"), key=lambda f: f.stat().st_mtime)
+
+    @classmethod
+    def remove_superseded(cls, engine):
+        # A file is superseded when the next one was written; other processes' snapshots may still read it
+        stores = cls.stores(engine)
+        now = time.time()
+        for old_path, newer_path in zip(stores, stores[1:]):
+            if now - newer_path.stat().st_mtime > TRIP_STORE_GRACE_SECONDS:
+                old_path.unlink(missing_ok=True)
+                old_path.with_name(old_path.name + ".wal").unlink(missing_ok=True)
+
+    @staticmethod
+    def connect(path, engine, read_only=True):
+        if engine == "duckdb":
+            import duckdb
+            return duckdb.connect(str(path), read_only=read_only)
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True) if read_only else sqlite3.connect(path)
+
+    @classmethod
+    def read_meta(cls, path, engine):
+        if not path.exists():
+            return None
+        try:
+            con = cls.connect(path, engine)
+            try:
+                return json.loads(con.execute("SELECT value FROM meta WHERE key = 'trips'").fetchone()[0])
+            finally:
+                con.close()
+        except Exception:
+            return None
+
+    @classmethod
+    @instrumented("trip_store.write")
+    def write(cls, path, engine, beer, sources, previous=None):
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # This writer's own temp file, so concurrent writers never remove or replace each other's
+        tmp_path = CACHE_DIR / f".{path.name}.{os.getpid()}-{uuid.uuid4().hex}.tmp"
+        # Per-row hashes: the digest of beer's first rows tells whether the previous file holds exactly those
+        row_hashes = pd.util.hash_pandas_object(beer, index=False).to_numpy()
+        meta = {
+            "sources": sources,
+            "rows": len(beer),
+            "digest": hashlib.sha1(row_hashes.tobytes()).hexdigest(),
+            "dtypes": {col: str(beer[col].dtype) for col in beer.columns},
+            "min_date": str(beer["Trip Date"].min()),
+            "max_date": str(beer["Trip Date"].max()),
+            "statuses": beer["Trip Status"].unique().tolist(),
+        }
+        try:
+            previous_meta = cls.read_meta(previous, engine) if previous is not None else None
+            if (previous_meta is not None and previous_meta["rows"] <= len(beer) and previous_meta.get("digest")
+                    == hashlib.sha1(row_hashes[:previous_meta["rows"]].tobytes()).hexdigest()):
+                try:
+                    shutil.copyfile(previous, tmp_path)
+                    cls.write_rows(tmp_path, engine, beer.iloc[previous_meta["rows"]:], previous_meta["rows"], meta)
+                    os.replace(tmp_path, path)
+                    logger.info("Trip store %s: appended %s trips to %s", path.name, len(beer) - previous_meta["rows"], previous.name)
+                    return meta
+                except Exception:
+                    logger.exception("Appending to trip store %s failed, rewriting it", previous.name)
+                    tmp_path.unlink(missing_ok=True)
+            cls.write_rows(tmp_path, engine, beer, 0, meta)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+            tmp_path.with_name(tmp_path.name + ".wal").unlink(missing_ok=True)
+        return meta
+
+    @classmethod
+    def write_rows(cls, path, engine, beer, first_row, meta):
+        # Writes beer as rows first_row onwards: a new table (and indexes) at 0, appended to the copied
+        # previous file otherwise
+        con = cls.connect(path, engine, read_only=False)
+        try:
+            if engine == "duckdb":
+                # The table is written in Trip Date order, DuckDB's per-block min/max then prunes date ranges.
+                # Categoricals go in as text like in SQLite: as ENUMs, appended trips with new values wouldn't fit.
+                frame = beer.astype({col: object for col in beer.columns if isinstance(beer[col].dtype, pd.CategoricalDtype)})
+                con.register("beer_frame", frame.assign(_row=np.arange(first_row, first_row + len(beer))))
+                con.execute("INSERT INTO trips SELECT * FROM beer_frame" if first_row else "CREATE TABLE trips AS SELECT * FROM beer_frame")
+                con.unregister("beer_frame")
+            else:
+                cls.write_sqlite(con, beer, first_row)
+            if first_row:
+                con.execute("UPDATE meta SET value = ? WHERE key = 'trips'", [json.dumps(meta)])
+            else:
+                for columns in TRIP_STORE_INDEXES:
+                    name = "idx_" + "_".join(col.lower().replace(" ", "_") for col in columns)
+                    con.execute(f"CREATE INDEX {name} ON trips ({', '.join(quote(col) for col in columns)})")
+                con.execute("CREATE TABLE meta (key TEXT, value TEXT)")
+                con.execute("INSERT INTO meta VALUES ('trips', ?)", [json.dumps(meta)])
+            if engine == "sqlite":
+                con.commit()
+        finally:
+            con.close()
+
+    @staticmethod
+    def write_sqlite(con, beer, first_row=0):
+        # Trip Date as int64 nanoseconds, _row (the position in the whole trips table) as the rowid
+        def column_type(dtype):
+            if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_datetime64_any_dtype(dtype):
+                return "INTEGER"
+            return "REAL" if pd.api.types.is_float_dtype(dtype) else "TEXT"
+        if not first_row:
+            columns = ", ".join(f"{quote(col)} {column_type(beer[col].dtype)}" for col in beer.columns)
+            con.execute(f"CREATE TABLE trips (_row INTEGER PRIMARY KEY, {columns})")
+        insert = f"INSERT INTO trips VALUES ({', '.join('?' * (len(beer.columns) + 1))})"
+        for start in range(0, len(beer), EXPORT_CHUNK_ROWS):
+            chunk = beer.iloc[start:start + EXPORT_CHUNK_ROWS]
+            values = {"_row": range(first_row + start, first_row + start + len(chunk))}
+            for col in beer.columns:
+                values[col] = sqlite_values(chunk[col])
+            con.executemany(insert, zip(*values.values()))
+
+    def where(self, start_date, end_date, selected_statuses):
+        start, end = date_range_bounds(start_date, end_date)
+        bounds = [start.value, end.value] if self.engine == "sqlite" else [start.to_pydatetime(), end.to_pydatetime()]
+        clause, params = '"Trip Date" >= ? AND "Trip Date" < ?', bounds
+        # Like status_mask: no status condition when every status present is selected
+        if selected_statuses and not set(self.statuses) <= set(selected_statuses):
+            clause += f' AND "Trip Status" IN ({", ".join("?" * len(selected_statuses))})'
+            params = params + [str(status) for status in selected_statuses]
+        return clause, params
+
+    def query(self, sql, params):
+        con = self.connect(self.path, self.engine)
+        try:
+            if self.engine == "duckdb":
+                return con.execute(sql, params).df()
+            return pd.read_sql_query(sql, con, params=params)
+        finally:
+            con.close()
+
+    @instrumented("trip_store.select")
+    def select(self, start_date, end_date, selected_statuses):
+        # The selection as filter_data_by_date_and_status would return it from the in-memory trips
+        clause, params = self.where(start_date, end_date, selected_statuses)
+        df = self.query(f"SELECT {', '.join(quote(col) for col in self.columns)} FROM trips WHERE {clause} ORDER BY _row", params)
+        if self.engine == "sqlite":
+            df["Trip Date"] = pd.to_datetime(df["Trip Date"], unit="ns")
+        return df.astype(self.meta["dtypes"])
+
+    @instrumented("trip_store.daily_aggregates")
+    def daily_aggregates(self, start_date, end_date, selected_statuses):
+        # Same frame as daily_aggregates(selection), grouped by the database
+        clause, params = self.where(start_date, end_date, selected_statuses)
+        if self.engine == "sqlite":
+            day = f'"Trip Date" / {NS_PER_DAY} * {NS_PER_DAY}'
+        else:
+            day = "date_trunc('day', \"Trip Date\")"
+        completed = '"Trip Status" = \'Job Completed\''
+        pay, distance = '"Trip Pay Amount"', '"Trip Distance (KM/Mi)"'
+        daily = self.query(f"""
+            SELECT {day} AS day,
+                   COALESCE(SUM(CASE WHEN {completed} THEN {pay} END), 0) AS total_value,
+                   COALESCE(SUM("Company Commission Cleaned"), 0) AS commissions,
+                   SUM(CASE WHEN {completed} THEN 1 ELSE 0 END) AS completed,
+                   COUNT(*) AS requests,
+                   COALESCE(SUM(CASE WHEN {completed} THEN {distance} END), 0) AS completed_distance,
+                   SUM(CASE WHEN instr("Trip Status", 'Cancel') > 0 THEN 1 ELSE 0 END) AS cancellations,
+                   AVG(CASE WHEN {completed} THEN {pay} / (CASE WHEN {distance} = 0 THEN 1.0 ELSE {distance} END) END) AS price_per_km,
+                   COUNT(DISTINCT "Driver") AS active_drivers,
+                   COUNT(DISTINCT "Passenger") AS riders,
+                   COUNT("Passenger") AS rider_trips
+            FROM trips WHERE {clause} GROUP BY day ORDER BY day""", params)
+        days = pd.to_datetime(daily.pop("day"), unit="ns") if self.engine == "sqlite" else pd.to_datetime(daily.pop("day"))
+        # AVG over no completed trips is NULL, which comes back as None
+        daily["price_per_km"] = daily["price_per_km"].astype(float)
+        return daily.set_axis(pd.DatetimeIndex(days, name="Trip Date Only").astype(self.meta["dtypes"]["Trip Date"]))
+
+def sqlite_values(series):
+    # Python values sqlite3 can bind: None for missing, int nanoseconds for timestamps
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values = series.to_numpy(dtype="datetime64[ns]").astype("int64").astype(object)
+        values[series.isna().to_numpy()] = None
+        return values
+    return series.to_numpy(dtype=object, na_value=None)
+
+def filter_options(snapshot):
+    # Date bounds and statuses offered by the sidebar filters, all selected by default
+    if snapshot.trip_store is not None:
+        return snapshot.trip_store.min_date, snapshot.trip_store.max_date, snapshot.trip_store.statuses
+    beer = snapshot.beer
+    if beer is None:
+        return dt(2020, 1, 1), dt.today(), []
+    return beer["Trip Date"].min(), beer["Trip Date"].max(), beer["Trip Status"].unique().tolist()
+
+def snapshot_context(snapshot, start_date, end_date, selected_statuses, kpi_cache=None):
+    return AnalysisContext(snapshot.beer, snapshot.passengers, snapshot.drivers, snapshot.union_staff_names, start_date, end_date,
+                           selected_statuses, snapshot.daily_rollup, snapshot_version=snapshot.version, kpi_cache=kpi_cache,
+                           staff_trips=snapshot.staff_trips, entity_activity=snapshot.entity_activity,
+                           user_cohorts=snapshot.user_cohorts, location_activity=snapshot.location_activity,
+                           trip_store=snapshot.trip_store)
+
+def build_snapshot(version, fingerprints):
+    tables = list(load_all_data())
+    trip_store = None
+    if TRIP_BACKEND in ("sqlite", "duckdb") and tables[2] is not None:
+        trip_store = TripStore.open(tables[2], table_sources("beer", fingerprints))
+        # From here on the trips are read from the store, not kept in memory
+        tables[2] = None
+    return DataSnapshot(version, dt.now(), fingerprints, *tables, trip_store=trip_store)
+
+class SnapshotStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._snapshot = build_snapshot(1, {name: file_fingerprint(path) for name, path in FILES.items()})
+        self.kpi_cache = KPIResultCache(KPI_CACHE_ENTRIES, KPI_CACHE_BYTES, version=1)
+        self.last_checked = dt.now()
+        self.last_error = None
+
+    def current(self):
+        with self._lock:
+            return self._snapshot
+
+    def refresh(self):
+        # Rebuild only when a source workbook changed; on failure keep serving the old snapshot
+        with self._refresh_lock:
+            self.last_checked = dt.now()
+            fingerprints = {name: file_fingerprint(path) for name, path in FILES.items()}
+            current = self.current()
+            if fingerprints == current.fingerprints:
+                return False
+            try:
+                perf_start_run("refresh")
+                snapshot = build_snapshot(current.version + 1, fingerprints)
+            except Exception as e:
+                logger.exception("Data refresh failed, keeping snapshot v%s", current.version)
+                self.last_error = f"{dt.now():%Y-%m-%d %H:%M:%S}: {e}"
+                return False
+            finally:
+                perf_finish_run()
+            if WARM_UP:
+                # Warmed before the swap, so no rerun sees the new snapshot with a cold cache
+                self.kpi_cache.accept(snapshot.version)
+                self.warm(snapshot)
+            with self._lock:
+                self._snapshot = snapshot
+            self.kpi_cache.invalidate(snapshot.version)
+            self.last_error = None
+            logger.info("Swapped in data snapshot v%s", snapshot.version)
+            return True
+
+    def warm(self, snapshot=None):
+        # The default view (every date and status) is what the first rerun after a start or refresh shows;
+        # computing its KPI groups here means that rerun only reads the KPI cache. Best effort: a failure
+        # is logged and the reruns compute the groups themselves.
+        snapshot = snapshot or self.current()
+        try:
+            min_date, max_date, statuses = filter_options(snapshot)
+            if not statuses:
+                return
+            started = time.perf_counter()
+            ctx = snapshot_context(snapshot, pd.Timestamp(min_date).date(), pd.Timestamp(max_date).date(), statuses, self.kpi_cache)
+            for group in (ctx.overview_kpis, ctx.chart_data, ctx.financial_kpis, ctx.user_kpis, ctx.geographic_kpis):
+                group()
+            logger.info("Warmed the KPI cache for snapshot v%s in %.2fs", snapshot.version, time.perf_counter() - started)
+        except Exception:
+            logger.exception("Warming the KPI cache for snapshot v%s failed", snapshot.version)
+
+def run_refresher(store, interval):
+    scheduler = schedule.Scheduler()
+    scheduler.every(interval).seconds.do(store.refresh)
+    while True:
+        scheduler.run_pending()
+        time.sleep(1)
+
+@st.cache_resource(show_spinner="Loading data...")
+def get_snapshot_store():
+    # One store per server process; the first load is the only one a user ever waits for
+    store = SnapshotStore()
+    if WARM_UP:
+        # In the background: the first rerun renders as soon as the data is loaded and picks up the warmed
+        # groups as they land, instead of waiting for all of them
+        threading.Thread(target=store.warm, name="kpi-warm-up", daemon=True).start()
+    if REFRESH_INTERVAL_SECONDS > 0:
+        threading.Thread(target=run_refresher, args=(store, REFRESH_INTERVAL_SECONDS), name="data-refresher",
+                         daemon=True).start()
+    return store
+
+# Incremental ingestion of BEER.xlsx
+def trips_high_water_mark(raw_beer, beer):
+    # How many export rows have been processed and which end of the sheet new trips land on
+    raw_dates = clean_date(raw_beer["Trip Date"]).dropna()
+    return {
+        "rows": len(raw_beer),
+        "newest_first": bool(len(raw_dates) > 1 and raw_dates.iloc[0] > raw_dates.iloc[-1]),
+    }
+
+def rows_digest(df):
+    return hashlib.sha1(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+def payments_high_water_mark(raw_transactions):
+    # Like the trips' mark, plus a digest of the rows so edits to already processed payments are noticed
+    raw_dates = clean_date(raw_transactions["Date"]).dropna() if "Date" in raw_transactions.columns else pd.Series()
+    return {
+        "rows": len(raw_transactions),
+        "newest_first": bool(len(raw_dates) > 1 and raw_dates.iloc[0] > raw_dates.iloc[-1]),
+        "digest": rows_digest(raw_transactions),
+    }
+
+def split_payment_rows(raw_transactions, high_water_mark):
+    # (processed rows, rows added since the mark) of the TRANSACTIONS export; None means "rebuild", when
+    # the export shrank or a processed row changed (or a column's dtype did, which changes its digest)
+    if raw_transactions is None or high_water_mark is None or len(raw_transactions) < high_water_mark["rows"]:
+        return None
+    new_count = len(raw_transactions) - high_water_mark["rows"]
+    if high_water_mark["newest_first"]:
+        old, new = raw_transactions.iloc[new_count:], raw_transactions.iloc[:new_count]
+    else:
+        old, new = raw_transactions.iloc[:high_water_mark["rows"]], raw_transactions.iloc[high_water_mark["rows"]:]
+    if rows_digest(old) != high_water_mark["digest"]:
+        return None
+    return old, new
+
+def patch_paid_trips(beer, old_payments, new_payments):
+    # Re-joins the stored trips that new payments are for. Only trips without an earlier payment can be
+    # patched: nothing was filled in from TRANSACTIONS yet, so their stored commission and pay mode are still
+    # the BEER values the join starts from. Returns (trips, changed rows), or None when a full rebuild is needed.
+    def trip_payments(payments):
+        return payments[payments["Type"] == "Trip"] if "Type" in payments.columns else payments
+    new_payments = trip_payments(new_payments)
+    if not len(new_payments):
+        return beer, 0
+    if "Id" not in beer.columns or "Trip ID" not in new_payments.columns:
+        # Matched by driver, passenger and time: a new payment can move others to different trips
+        return None
+    rows = np.flatnonzero(beer["Id"].isin(new_payments["Trip ID"]).to_numpy())
+    if not len(rows):
+        return beer, 0
+    if beer["Id"].iloc[rows].isin(trip_payments(old_payments)["Trip ID"]).any():
+        return None
+    paid = join_transactions(beer.iloc[rows].reset_index(drop=True), clean_transactions(new_payments.copy()))
+    commission = beer["Company Commission Cleaned"].to_numpy(dtype=float, copy=True)
+    pay_mode = beer["Pay Mode"].to_numpy(dtype=object, copy=True)
+    new_commission = paid["Company Commission Cleaned"].fillna(0.0).to_numpy(dtype=float)
+    new_pay_mode = fill_pay_mode(paid["Pay Mode"].astype(object)).to_numpy(dtype=object)
+    changed = int(((commission[rows] != new_commission) | (pay_mode[rows] != new_pay_mode)).sum())
+    if not changed:
+        return beer, 0
+    commission[rows] = new_commission
+    pay_mode[rows] = new_pay_mode
+    # Same dtypes a full rebuild would give (e.g. whole UGX amounts as int64)
+    return compact_trips(beer.assign(**{"Company Commission Cleaned": commission, "Pay Mode": pay_mode})), changed
+
+def read_new_trip_rows(filepath, high_water_mark):
+    # Stream the sheet and keep only the rows added since the high-water mark: the top rows of a
+    # newest-first export, the bottom rows otherwise. None means "rebuild".
+    from openpyxl import load_workbook
+    try:
+        workbook = load_workbook(filepath, read_only=True, data_only=True)
+    except Exception:
+        return None
+    try:
+        sheet = workbook.worksheets[0]
+        if not sheet.max_row:
+            return None
+        total_rows = sheet.max_row - 1
+        new_count = total_rows - high_water_mark["rows"]
+        if new_count < 0:
+            return None
+        header = list(next(sheet.iter_rows(max_row=1, values_only=True)))
+        if high_water_mark["newest_first"]:
+            new_rows = list(sheet.iter_rows(min_row=2, max_row=new_count + 1, values_only=True)) if new_count else []
+        else:
+            new_rows = list(sheet.iter_rows(min_row=high_water_mark["rows"] + 2, values_only=True))
+    except Exception:
+        return None
+    finally:
+        workbook.close()
+    if len(new_rows) != new_count:
+        return None
+    return pd.DataFrame(new_rows, columns=header), total_rows
+
+def append_trips(beer, new_trips):
+    if list(beer.columns) != list(new_trips.columns):
+        return None
+    combined = {}
+    for col in beer.columns:
+        if isinstance(beer[col].dtype, pd.CategoricalDtype) and isinstance(new_trips[col].dtype, pd.CategoricalDtype):
+            old_values, new_values = beer[col].array, new_trips[col].array
+            # An all-empty column has no categories to agree on, so it takes the other side's
+            if not len(new_values.categories):
+                new_values = pd.Categorical.from_codes(new_values.codes, dtype=old_values.dtype)
+            elif not len(old_values.categories):
+                old_values = pd.Categorical.from_codes(old_values.codes, dtype=new_values.dtype)
+            if old_values.dtype == new_values.dtype:
+                combined[col] = pd.concat([pd.Series(old_values), pd.Series(new_values)], ignore_index=True)
+                continue
+            try:
+                combined[col] = union_categoricals([old_values, new_values])
+            except TypeError:
+                return None
+        else:
+            combined[col] = pd.concat([beer[col], new_trips[col]], ignore_index=True)
+            if combined[col].dtype != beer[col].dtype:
+                # e.g. fractional UGX amounts arriving in an int64 column: the stored parts no longer agree
+                return None
+    return pd.DataFrame(combined)
+
+def merge_rollups(rollup, new_rollup):
+    merged = pd.concat([rollup, new_rollup], ignore_index=True)
+    merged = merged.groupby(ROLLUP_KEYS, observed=True, dropna=False).sum().reset_index()
+    return merged.astype({"Trip Status": "category"})
+
+@instrumented()
+def append_new_trips(manifest, fingerprints):
+    # Returns the refreshed trips table, or None when a full rebuild is needed. New BEER rows are cleaned,
+    # joined and appended; new TRANSACTIONS rows re-join only the stored trips they pay for.
+    entry = manifest["tables"].get("beer")
+    if entry is None or "high_water_mark" not in entry or fingerprints["beer"] is None:
+        return None
+    started = dt.now()
+    beer = read_table_parts("beer")
+    if beer is None:
+        return None
+    if entry["sources"][0] != fingerprints["beer"]:
+        new_rows = read_new_trip_rows(FILES["beer"], entry["high_water_mark"])
+        if new_rows is None:
+            return None
+        new_raw, total_rows = new_rows
+    else:
+        new_raw, total_rows = pd.DataFrame(), entry["high_water_mark"]["rows"]
+    payments_mark = entry.get("payments_high_water_mark")
+    payments_changed = entry["sources"][1] != fingerprints["transactions"]
+    transactions = None
+    if fingerprints["transactions"] is not None and (len(new_raw) or payments_changed):
+        transactions = load_excel_file(FILES["transactions"])
+    patched, new_payments = 0, 0
+    if payments_changed:
+        payment_rows = split_payment_rows(transactions, payments_mark)
+        if payment_rows is None:
+            return None
+        old_payments, added_payments = payment_rows
+        new_payments = len(added_payments)
+        payments_mark = payments_high_water_mark(transactions)
+        patch = patch_paid_trips(beer, old_payments, added_payments)
+        if patch is None:
+            return None
+        beer, patched = patch
+    combined, new_part = beer, beer.iloc[:0]
+    if len(new_raw):
+        _, _, new_trips, _ = preprocess_data(None, None, new_raw, transactions, None)
+        combined = append_trips(beer, new_trips)
+        if combined is None:
+            return None
+        new_part = combined.iloc[len(beer):]
+    if patched or (len(beer) and len(new_part) and new_part["Trip Date"].min() < beer["Trip Date"].iloc[-1]):
+        # Stored trips were patched, or some new trips are dated before them: re-sort and rewrite the table
+        combined = sort_trips(combined)
+        write_cached_table("beer", combined)
+    elif len(new_part):
+        write_table_part("beer", new_part, len(list((CACHE_DIR / "beer").glob("part-*.parquet"))))
+    if not patched:
+        # Mergeable derived tables are updated from the new trips alone; after a patch their sources no
+        # longer match and load_all_data rebuilds them, like the others
+        for name, merge in DERIVED_MERGERS.items():
+            if not len(new_part):
+                if name in manifest["tables"]:
+                    manifest["tables"][name]["sources"] = table_sources(name, fingerprints)
+                continue
+            derived = read_table_parts(name)
+            if derived is not None:
+                cache_table(name, merge(derived, DERIVED_BUILDERS[name](new_part)), manifest, fingerprints)
+    manifest["tables"]["beer"] = {
+        "sources": table_sources("beer", fingerprints),
+        "high_water_mark": {**entry["high_water_mark"], "rows": total_rows},
+        "payments_high_water_mark": payments_mark,
+    }
+    manifest.setdefault("reports", {})["incremental"] = {"trips": {
+        "refreshed_at": started.isoformat(timespec="seconds"),
+        "new_rows": len(new_raw),
+        "new_payments": new_payments,
+        "patched_trips": patched,
+        "total_rows": len(combined),
+        "seconds": (dt.now() - started).total_seconds(),
+    }}
+    return combined
+
+@instrumented()
+def preprocess_data(passengers, drivers, beer, transactions, union_staff, report=None):
+    # report, if given, collects per-column counts of amounts coerced to 0.0 ("cleaning")
+    # and the trips table's bytes per row before and after compaction ("memory")
+    cleaning = report.setdefault("cleaning", {}) if report is not None else None
     # Clean passengers
     if passengers is not None:
         passengers["Created"] = clean_date(passengers.get("Created", pd.Series(dtype=str)))
-        passengers["Wallet Balance"] = clean_ugx_amount(passengers.get("Wallet Balance", pd.Series(dtype=str)))
+        passengers["Wallet Balance"] = clean_ugx_amount(passengers.get("Wallet Balance", pd.Series(dtype=str)), cleaning, "passengers.Wallet Balance")
     # Clean drivers
     if drivers is not None:
         drivers["Created"] = clean_date(drivers.get("Created", pd.Series(dtype=str)))
-        drivers["Wallet Balance"] = clean_ugx_amount(drivers.get("Wallet Balance", pd.Series(dtype=str)))
+        drivers["Wallet Balance"] = clean_ugx_amount(drivers.get("Wallet Balance", pd.Series(dtype=str)), cleaning, "drivers.Wallet Balance")
     # Clean beer (trips)
     if beer is not None:
         beer["Trip Date"] = clean_date(beer.get("Trip Date", pd.Series(dtype=str)))
         beer["Trip Status"] = beer.get("Trip Status", pd.Series(dtype=str)).fillna("Unknown")
-        beer["Trip Pay Amount"] = clean_ugx_amount(beer.get("Trip Pay Amount", pd.Series(dtype=str)))
+        beer["Trip Pay Amount"] = clean_ugx_amount(beer.get("Trip Pay Amount", pd.Series(dtype=str)), cleaning, "beer.Trip Pay Amount")
         beer["Trip Distance (KM/Mi)"] = clean_distance(beer.get("Trip Distance (KM/Mi)", pd.Series(dtype=str)))
-        beer["Company Commission Cleaned"] = clean_ugx_amount(beer.get("Company Commission Cleaned", pd.Series(dtype=str)))
+        beer["Company Commission Cleaned"] = clean_ugx_amount(beer.get("Company Commission Cleaned", pd.Series(dtype=str)), cleaning, "beer.Company Commission Cleaned")
         beer["Pay Mode"] = fill_pay_mode(beer.get("Pay Mode", pd.Series(dtype=str)))
         beer["Driver"] = beer.get("Driver", pd.Series(dtype=str)).fillna("Unknown")
         beer["Passenger"] = beer.get("Passenger", pd.Series(dtype=str)).fillna("Unknown")
         beer["Pickup Location"] = beer.get("Pickup Location", pd.Series(dtype=str)).fillna("Unknown")
         beer["Dropoff Location"] = beer.get("Dropoff Location", pd.Series(dtype=str)).fillna("Unknown")
+        # Trips without a usable date can never fall inside a date filter; dropping them keeps the table
+        # sorted end to end, which incremental appends rely on
+        undated = beer["Trip Date"].isna()
+        if cleaning is not None:
+            cleaning["beer.Trip Date"] = {"missing": int(undated.sum()), "dropped": int(undated.sum())}
+        beer = sort_trips(beer[~undated])
         # Merge transactions if Company Commission Cleaned or Pay Mode missing or zero
         if transactions is not None:
-            transactions["Company Amt (UGX)"] = clean_ugx_amount(transactions.get("Company Amt (UGX)", pd.Series(dtype=str)))
-            transactions["Pay Mode"] = fill_pay_mode(transactions.get("Pay Mode", pd.Series(dtype=str)))
-            # Merge on index or a common key if available - assuming index alignment here
-            if "Company Commission Cleaned" not in beer.columns or beer["Company Commission Cleaned"].sum() == 0:
-                if len(transactions) == len(beer):
-                    beer["Company Commission Cleaned"] = transactions["Company Amt (UGX)"]
-            if "Pay Mode" not in beer.columns or beer["Pay Mode"].isnull().all():
-                if len(transactions) == len(beer):
-                    beer["Pay Mode"] = transactions["Pay Mode"]
+            beer = join_transactions(beer, clean_transactions(transactions, cleaning), report)
+        beer["Company Commission Cleaned"] = beer["Company Commission Cleaned"].fillna(0.0)
+        beer["Pay Mode"] = fill_pay_mode(beer["Pay Mode"])
+        beer = compact_trips(beer, report)
     # Clean union staff
     if union_staff is not None:
         union_staff_names = union_staff.iloc[:, 0].dropna().astype(str).tolist()
     else:
         union_staff_names = []
+    passengers, drivers = (_parquet_safe(df) if df is not None else None for df in (passengers, drivers))
     return passengers, drivers, beer, union_staff_names
 
-def filter_data_by_date_and_status(beer, start_date, end_date, selected_statuses):
+def clean_transactions(transactions, cleaning=None):
+    transactions["Company Amt (UGX)"] = clean_ugx_amount(transactions.get("Company Amt (UGX)", pd.Series(dtype=str)), cleaning, "transactions.Company Amt (UGX)")
+    transactions["Pay Mode"] = fill_pay_mode(transactions.get("Pay Mode", pd.Series(dtype=str)))
+    return transactions
+
+# Transactions join: BEER "Id" is the TRANSACTIONS "Trip ID". Exports without the id fall back to
+# the first payment by the same driver and passenger (and Trip Status, when the payments have one) within
+# TRANSACTION_MATCH_TOLERANCE of the trip; a payment goes to its nearest trip only
+TRANSACTION_MATCH_TOLERANCE = pd.Timedelta(hours=3)
+
+def pair_codes(left, right, columns):
+    # One int64 key per distinct combination of columns, shared by both frames (asof "by" on ints is much faster)
+    key = np.zeros(len(left) + len(right), dtype="int64")
+    for col in columns:
+        codes, uniques = pd.factorize(pd.concat([left[col], right[col]], ignore_index=True))
+        key = key * (len(uniques) + 1) + codes + 1
+    return key[:len(left)], key[len(left):]
+
+def transaction_positions_by_time(beer, transactions):
+    # Returns each trip's payment position (-1 if none) and how many extra trips matched a payment
+    # that already went to a nearer trip
+    keys = ["Driver", "Passenger"] + (["Trip Status"] if "Trip Status" in transactions.columns else [])
+    trip_keys, payment_keys = pair_codes(beer, transactions, keys)
+    trips = pd.DataFrame({"row": np.arange(len(beer)), "pair": trip_keys, "Trip Date": beer["Trip Date"].to_numpy()})
+    trips = trips.dropna(subset=["Trip Date"]).sort_values("Trip Date", kind="stable")
+    payments = pd.DataFrame({"position": np.arange(len(transactions)), "pair": payment_keys, "Date": clean_date(transactions["Date"]).to_numpy()})
+    payments = payments.dropna(subset=["Date"]).sort_values("Date", kind="stable")
+    matches = pd.merge_asof(trips, payments, left_on="Trip Date", right_on="Date", by="pair",
+                            tolerance=TRANSACTION_MATCH_TOLERANCE, direction="forward")
+    matches = matches.dropna(subset=["position"])
+    # Several trips of a pair can fall before the same payment: keep the one closest to it
+    nearest = matches.assign(gap=matches["Date"] - matches["Trip Date"]).sort_values("gap", kind="stable")
+    nearest = nearest.drop_duplicates("position")
+    positions = np.full(len(beer), -1)
+    positions[nearest["row"].to_numpy()] = nearest["position"].astype("int64").to_numpy()
+    return positions, len(matches) - len(nearest)
+
+@instrumented()
+def join_transactions(beer, transactions, report=None):
+    # Fill missing or zero commission and missing pay mode on each trip from its matching payment
+    payments = transactions[transactions["Type"] == "Trip"] if "Type" in transactions.columns else transactions
+    duplicate_matches = 0
+    if "Id" in beer.columns and "Trip ID" in payments.columns:
+        method = "trip_id"
+        payments = payments.groupby("Trip ID").agg(**{"Company Amt (UGX)": ("Company Amt (UGX)", "sum"), "Pay Mode": ("Pay Mode", "last")})
+        positions = payments.index.get_indexer(beer["Id"])
+    elif {"Driver", "Passenger", "Date"}.issubset(payments.columns):
+        method = "driver_passenger_time"
+        positions, duplicate_matches = transaction_positions_by_time(beer, payments)
+    else:
+        method = None
+        positions = np.full(len(beer), -1)
+    matched = positions >= 0
+    commission = beer["Company Commission Cleaned"]
+    fill_commission = matched & (commission.isna() | (commission == 0)).to_numpy()
+    # A trailing sentinel makes position -1 (no match) safe to index with
+    amounts = np.append(payments["Company Amt (UGX)"].to_numpy(dtype=float), np.nan)[positions]
+    beer["Company Commission Cleaned"] = np.where(fill_commission, amounts, commission)
+    pay_mode = beer["Pay Mode"]
+    fill_pay = matched & (pay_mode.isna() | (pay_mode == "Unknown")).to_numpy()
+    if fill_pay.any():
+        modes = pay_mode.to_numpy(dtype=object, copy=True)
+        modes[fill_pay] = payments["Pay Mode"].to_numpy(dtype=object)[positions[fill_pay]]
+        beer["Pay Mode"] = modes
+    if report is not None:
+        matched_payments = int(np.bincount(positions[matched], minlength=len(payments)).astype(bool).sum())
+        completed = (beer["Trip Status"] == "Job Completed").to_numpy()
+        report["join"] = {"transactions": {
+            "method": method,
+            "trips": len(beer),
+            "matched_trips": int(matched.sum()),
+            "trip_match_rate": float(matched.mean()) if len(beer) else 0.0,
+            "completed_match_rate": float(matched[completed].mean()) if completed.any() else 0.0,
+            "payments": len(payments),
+            "unmatched_payments": len(payments) - matched_payments,
+            "duplicate_matches_dropped": duplicate_matches,
+            "commission_filled": int(fill_commission.sum()),
+            "pay_mode_filled": int(fill_pay.sum()),
+        }}
+    return beer
+
+def sort_trips(beer):
+    # Sorted by Trip Date (NaT last) so date ranges are binary-search slices, status as categorical codes
+    beer["Trip Status"] = beer["Trip Status"].astype("category")
+    return beer.sort_values("Trip Date", kind="stable", na_position="last", ignore_index=True)
+
+# Compact trips schema: repeated strings become categoricals (Driver and Passenger codes act as
+# interned integer IDs), distance is float32 and UGX amounts int64 when they are whole shillings
+CATEGORICAL_COLUMNS = ["Trip Status", "Pay Mode", "Pickup Location", "Dropoff Location", "Driver", "Passenger",
+                       "Trip Type", "Saved By", "From Location", "To Location"]
+UGX_COLUMNS = ["Trip Pay Amount", "Company Commission Cleaned"]
+
+def frame_bytes_per_row(df):
+    return float(df.memory_usage(deep=True).sum() / len(df)) if len(df) else 0.0
+
+@instrumented()
+def compact_trips(beer, report=None):
+    before = frame_bytes_per_row(beer) if report is not None else None
+    beer = beer.astype({col: "category" for col in CATEGORICAL_COLUMNS if col in beer.columns})
+    beer["Trip Distance (KM/Mi)"] = beer["Trip Distance (KM/Mi)"].astype("float32")
+    for col in UGX_COLUMNS:
+        values = beer[col]
+        if values.notna().all() and (values % 1 == 0).all():
+            beer[col] = values.astype("int64")
+    if report is not None:
+        report["memory"] = {"trips": {"rows": len(beer), "bytes_per_row_before": before, "bytes_per_row_after": frame_bytes_per_row(beer)}}
+    return beer
+
+def date_range_bounds(start_date, end_date):
+    # Date pickers return whole days: [start 00:00, day after end 00:00)
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+    return start, end
+
+def count_created_between(frame, start_date, end_date):
+    start, end = date_range_bounds(start_date, end_date)
+    return int(((frame["Created"] >= start) & (frame["Created"] < end)).sum())
+
+def trip_date_slice(beer, start_date, end_date, date_column="Trip Date"):
+    start, end = date_range_bounds(start_date, end_date)
+    lo, hi = np.searchsorted(beer[date_column].to_numpy(), [start.to_datetime64(), end.to_datetime64()])
+    return slice(int(lo), int(hi))
+
+def status_mask(status, selected_statuses):
+    # Boolean mask over categorical codes, None when every status present is selected
+    if isinstance(status.dtype, pd.CategoricalDtype):
+        wanted = status.cat.categories.isin(selected_statuses)
+        if wanted.all():
+            return None
+        return np.append(wanted, False)[status.cat.codes.to_numpy()]
+    return status.isin(selected_statuses).to_numpy()
+
+@instrumented()
+def filter_data_by_date_and_status(beer, start_date, end_date, selected_statuses, date_column="Trip Date"):
+    # Expects beer as returned by preprocess_data (sorted by Trip Date); returns a view, not a copy.
+    # Also slices the daily rollup with date_column="Day".
     if beer is None:
         return None
-    df = beer.copy()
-    df = df[(df["Trip Date"] >= pd.to_datetime(start_date)) & (df["Trip Date"] <= pd.to_datetime(end_date))]
+    df = beer.iloc[trip_date_slice(beer, start_date, end_date, date_column)]
     if selected_statuses:
-        df = df[df["Trip Status"].isin(selected_statuses)]
+        mask = status_mask(df["Trip Status"], selected_statuses)
+        if mask is not None:
+            df = df[mask]
     return df
 
+# Daily rollup cube: one row per (day, Trip Status, Pay Mode)
+ROLLUP_KEYS = ["Day", "Trip Status", "Pay Mode"]
+ROLLUP_MEASURES = {
+    "pay": "Trip Pay Amount",
+    "commission": "Company Commission Cleaned",
+    "distance": "Trip Distance (KM/Mi)",
+}
+
+@instrumented()
+def build_daily_rollup(beer):
+    # Trip count plus sum and sum of squares of each measure, sorted by Day
+    if beer is None:
+        return None
+    dated = beer[beer["Trip Date"].notna()]
+    cube = pd.DataFrame({
+        "Day": dated["Trip Date"].dt.normalize(),
+        "Trip Status": dated["Trip Status"],
+        "Pay Mode": dated["Pay Mode"],
+        "trips": np.ones(len(dated), dtype="int64"),
+    })
+    for name, col in ROLLUP_MEASURES.items():
+        values = dated[col].astype(float)
+        cube[f"{name}_sum"] = values
+        cube[f"{name}_sumsq"] = values * values
+    return cube.groupby(ROLLUP_KEYS, observed=True, dropna=False).sum().reset_index()
+
+# Union staff index. UNION STAFF.xlsx is typed by hand, so staff names are matched to BEER passengers
+# after normalizing case, whitespace and unicode forms. Each distinct normalized name is one Staff ID,
+# with one row per passenger spelling that matches it.
+STAFF_INDEX_COLUMNS = ["Staff ID", "Union Staff", "Name Key", "Entries", "Passenger", "Exact", "Completed Trips"]
+STAFF_TRIP_COLUMNS = ["Trip Date", "Staff ID", "Union Staff", "Passenger", "Trip Pay Amount", "Trip Distance (KM/Mi)"]
+
+def normalize_names(names):
+    return (pd.Series(names, dtype="str").str.normalize("NFKC").str.casefold()
+            .str.replace(r"\s+", " ", regex=True).str.strip())
+
+def passenger_codes(beer):
+    passenger = beer["Passenger"]
+    if not isinstance(passenger.dtype, pd.CategoricalDtype):
+        passenger = passenger.astype("category")
+    return passenger.cat.categories, passenger.cat.codes.to_numpy()
+
+@instrumented()
+def build_staff_index(beer, union_staff):
+    if beer is None or union_staff is None:
+        return None
+    names = union_staff["Union Staff"].astype("str").reset_index(drop=True)
+    keys = normalize_names(names)
+    staff = (pd.DataFrame({"Union Staff": names, "Name Key": keys})[keys.ne("")]
+             .groupby("Name Key", sort=False).agg(**{"Union Staff": ("Union Staff", "first"), "Entries": ("Union Staff", "size")})
+             .reset_index())
+    staff.insert(0, "Staff ID", np.arange(1, len(staff) + 1))
+    # Normalize the distinct passenger names, not the trips
+    categories, codes = passenger_codes(beer)
+    staff_rows = pd.Index(staff["Name Key"]).get_indexer(normalize_names(categories))
+    matched = np.flatnonzero(staff_rows >= 0)
+    completed = (beer["Trip Status"] == "Job Completed").to_numpy()
+    trips = np.bincount(codes[completed & (codes >= 0)], minlength=len(categories))
+    spellings = pd.DataFrame({
+        "Name Key": staff["Name Key"].to_numpy()[staff_rows[matched]],
+        "Passenger": pd.Series(categories[matched], dtype="str"),
+        "Completed Trips": trips[matched],
+    })
+    index = staff.merge(spellings, on="Name Key", how="left")
+    index["Exact"] = index["Passenger"].isin(names)
+    index["Completed Trips"] = index["Completed Trips"].fillna(0).astype("int64")
+    return index[STAFF_INDEX_COLUMNS].sort_values("Staff ID", kind="stable", ignore_index=True)
+
+@instrumented()
+def build_staff_trips(beer, staff_index):
+    # Completed trips by staff passengers, still sorted by Trip Date so a date range is a slice
+    if beer is None or staff_index is None:
+        return None
+    spellings = staff_index.dropna(subset=["Passenger"])
+    categories, codes = passenger_codes(beer)
+    staff_of_category = np.append(pd.Index(spellings["Passenger"]).get_indexer(categories), -1)
+    rows = staff_of_category[codes]
+    keep = (rows >= 0) & (beer["Trip Status"] == "Job Completed").to_numpy()
+    trips = beer[keep]
+    staff = spellings.iloc[rows[keep]]
+    return pd.DataFrame({
+        "Trip Date": trips["Trip Date"].to_numpy(),
+        "Staff ID": staff["Staff ID"].to_numpy(),
+        "Union Staff": staff["Union Staff"].to_numpy(dtype=object),
+        "Passenger": trips["Passenger"].to_numpy(dtype=object),
+        "Trip Pay Amount": trips["Trip Pay Amount"].to_numpy(),
+        "Trip Distance (KM/Mi)": trips["Trip Distance (KM/Mi)"].to_numpy(),
+    }).astype({"Union Staff": "str", "Passenger": "str"})
+
+def staff_match_report(staff_index):
+    # One row per Staff ID: how its name was found among the BEER passengers, if at all. "normalized"
+    # means at least one passenger spelling only matched after normalizing, which exact matching missed.
+    report = staff_index.assign(Normalized=staff_index["Passenger"].notna() & ~staff_index["Exact"]).groupby("Staff ID", sort=True).agg(**{
+        "Union Staff": ("Union Staff", "first"),
+        "Entries": ("Entries", "first"),
+        "Spellings": ("Passenger", "count"),
+        "Normalized": ("Normalized", "any"),
+        "Completed Trips": ("Completed Trips", "sum"),
+    })
+    report.insert(2, "Match", np.select([report["Spellings"] == 0, report["Normalized"]], ["not in BEER", "normalized"], "exact"))
+    return report.drop(columns="Normalized")
+
+# Entity activity: one row per (Day, Trip Status, Role, Entity), Role being "Driver" or "Passenger" and
+# Entity the name. Per-driver and per-passenger metrics group these rows instead of the trips.
+ACTIVITY_KEYS = ["Day", "Trip Status", "Role", "Entity"]
+ACTIVITY_MEASURES = ["trips", "completed", "pay_sum", "commission_sum"]
+
+def activity_dtypes(activity):
+    return activity.astype({"Trip Status": "category", "Role": "category", "Entity": "category"})
+
+@instrumented()
+def build_entity_activity(beer):
+    if beer is None:
+        return None
+    dated = beer[beer["Trip Date"].notna()]
+    measures = pd.DataFrame({
+        "Day": dated["Trip Date"].dt.normalize(),
+        "Trip Status": dated["Trip Status"],
+        "trips": np.ones(len(dated), dtype="int32"),
+        "completed": (dated["Trip Status"] == "Job Completed").to_numpy(dtype="int32"),
+        "pay_sum": dated["Trip Pay Amount"].astype(float),
+        "commission_sum": dated["Company Commission Cleaned"].astype(float),
+    })
+    roles = [measures.assign(Role=role, Entity=dated[role]).groupby(ACTIVITY_KEYS, observed=True).sum().reset_index()
+             for role in ("Driver", "Passenger")]
+    return activity_dtypes(pd.concat(roles, ignore_index=True).sort_values("Day", kind="stable", ignore_index=True))
+
+def merge_activity(activity, new_activity):
+    merged = pd.concat([activity, new_activity], ignore_index=True)
+    merged = merged.groupby(ACTIVITY_KEYS, observed=True, sort=False).sum().reset_index()
+    return activity_dtypes(merged.sort_values("Day", kind="stable", ignore_index=True))
+
+def entity_totals(activity_rows):
+    # Trips, completed trips, pay and commission per (Role, Entity) of a selection, as bincounts over the
+    # category codes; a groupby here pays for every unused Entity category of the snapshot
+    roles, entities = activity_rows["Role"].cat, activity_rows["Entity"].cat
+    n_entities = len(entities.categories)
+    entity_codes = entities.codes.to_numpy()
+    has_entity = entity_codes >= 0
+    keys = roles.codes.to_numpy()[has_entity].astype(np.int64) * n_entities + entity_codes[has_entity]
+    size = len(roles.categories) * n_entities
+    sums = {col: np.bincount(keys, weights=np.nan_to_num(activity_rows[col].to_numpy(dtype=float)[has_entity]), minlength=size)
+            for col in ACTIVITY_MEASURES}
+    present = np.flatnonzero(np.bincount(keys, minlength=size))
+    index = pd.MultiIndex.from_arrays([
+        pd.Categorical.from_codes(present // n_entities, dtype=activity_rows["Role"].dtype),
+        pd.Categorical.from_codes(present % n_entities, dtype=activity_rows["Entity"].dtype),
+    ], names=["Role", "Entity"])
+    totals = pd.DataFrame({col: values[present] for col, values in sums.items()}, index=index)
+    return totals.astype({"trips": "int64", "completed": "int64"})
+
+def role_totals(totals, role):
+    return totals[totals.index.get_level_values("Role") == role].droplevel("Role")
+
+@instrumented()
+def build_user_cohorts(entity_activity, drivers, passengers):
+    # One row per registered driver and passenger: when they signed up and when they first took (or
+    # completed) a trip. DRIVERS/PASSENGERS names are matched to BEER names after normalize_names.
+    if entity_activity is None:
+        return None
+    first_trip = entity_activity.groupby(["Role", "Entity"], observed=True)["Day"].min()
+    completed = entity_activity[entity_activity["completed"] > 0]
+    first_completed = completed.groupby(["Role", "Entity"], observed=True)["Day"].min()
+    cohorts = []
+    for role, users in (("Driver", drivers), ("Passenger", passengers)):
+        if users is None or "Name" not in users.columns:
+            continue
+        keys = normalize_names(users["Name"].astype("str"))
+        firsts = {}
+        for col, days in (("First Trip", first_trip), ("First Completed Trip", first_completed)):
+            days = days[days.index.get_level_values("Role") == role].droplevel("Role")
+            # Several BEER spellings can normalize to the same name
+            firsts[col] = days.groupby(normalize_names(days.index).to_numpy()).min()
+        cohorts.append(pd.DataFrame({
+            "Role": role,
+            "Name": users["Name"].astype("str").to_numpy(),
+            "Created": users["Created"].to_numpy(),
+            "First Trip": keys.map(firsts["First Trip"]).to_numpy(),
+            "First Completed Trip": keys.map(firsts["First Completed Trip"]).to_numpy(),
+        }))
+    if not cohorts:
+        return None
+    return pd.concat(cohorts, ignore_index=True).astype({"Role": "category"})
+
+def activation_kpis(cohorts, start_date, end_date):
+    # Of the drivers and passengers who signed up in the range: the share that completed a trip since,
+    # how long that took, and a month-by-month cohort table
+    start, end = date_range_bounds(start_date, end_date)
+    joined = cohorts[(cohorts["Created"] >= start) & (cohorts["Created"] < end)]
+    days_to_first = (joined["First Completed Trip"] - joined["Created"].dt.normalize()).dt.days.clip(lower=0)
+    activated = joined["First Completed Trip"].notna()
+    kpis = {}
+    for role, prefix in (("Driver", "driver"), ("Passenger", "passenger")):
+        in_role = (joined["Role"] == role).to_numpy()
+        kpis[f"{prefix}_activation_rate"] = activated[in_role].mean() * 100 if in_role.any() else None
+        kpis[f"{prefix}_days_to_first_trip"] = days_to_first[in_role].median() if activated[in_role].any() else None
+    months = joined["Created"].dt.to_period("M").rename("Signed Up")
+    kpis["onboarding_cohorts"] = (pd.DataFrame({"Role": joined["Role"], "activated": activated, "days": days_to_first})
+                                  .groupby([months, "Role"], observed=True)
+                                  .agg(**{"Signed Up": ("activated", "size"), "Completed a Trip": ("activated", "sum"),
+                                          "Median Days to First Trip": ("days", "median")})
+                                  .unstack("Role"))
+    return kpis
+
+# Location dimension: pickup and dropoff addresses are normalized (case, spacing, ", Uganda" suffix) so
+# spelling variants count as one place. location_activity holds trips per (Day, Trip Status, Pickup,
+# Dropoff) with the zone of each place; places and zones are categoricals whose codes act as integer IDs.
+LOCATION_KEYS = ["Day", "Trip Status", "Pickup", "Dropoff"]
+# Exports without Pickup/Dropoff Location carry the addresses in From/To Location
+LOCATION_COLUMNS = {"Pickup": ("Pickup Location", "From Location"), "Dropoff": ("Dropoff Location", "To Location")}
+PLUS_CODE = r"(?i)\b[23456789cfghjmpqrvwx]{2,8}\+[23456789cfghjmpqrvwx]*"
+
+def normalize_locations(values):
+    labels = (normalize_names(values).str.replace(r"\s*,\s*", ", ", regex=True)
+              .str.replace(r",?\s*uganda$", "", regex=True).str.strip(" ,").str.title()
+              .str.replace(PLUS_CODE, lambda match: match.group(0).upper(), regex=True))
+    return labels.mask(labels == "", "Unknown")
+
+def location_labels(series):
+    # Normalized label per trip as a categorical (sorted categories, "Unknown" for missing values); only
+    # the distinct strings are normalized
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype("category")
+    labels = normalize_locations(series.cat.categories)
+    categories = pd.Index(labels).append(pd.Index(["Unknown"])).unique().sort_values()
+    label_codes = np.append(categories.get_indexer(labels), categories.get_loc("Unknown"))
+    return pd.Categorical.from_codes(label_codes[series.cat.codes.to_numpy()], categories=categories)
+
+def trip_locations(beer, role):
+    column, fallback = LOCATION_COLUMNS[role]
+    labels = location_labels(beer[column]) if column in beer.columns else None
+    if fallback not in beer.columns:
+        return labels
+    fallback_labels = location_labels(beer[fallback])
+    if labels is None:
+        return fallback_labels
+    categories = labels.categories.union(fallback_labels.categories)
+    labels, fallback_labels = labels.set_categories(categories), fallback_labels.set_categories(categories)
+    return pd.Categorical.from_codes(np.where(labels == "Unknown", fallback_labels.codes, labels.codes), categories=categories)
+
+def location_dtypes(activity):
+    # Zones are looked up once per distinct place
+    activity = activity.astype({"Trip Status": "category", "Pickup": "category", "Dropoff": "category"})
+    for role in ("Pickup", "Dropoff"):
+        places = activity[role].cat.remove_unused_categories()
+        zones = location_zones(places.cat.categories)
+        zone_names = pd.Index(zones.unique()).sort_values()
+        activity[role] = places
+        activity[f"{role} Zone"] = pd.Categorical.from_codes(zone_names.get_indexer(zones)[places.cat.codes.to_numpy()],
+                                                             categories=zone_names)
+    return activity
+
+@instrumented()
+def build_location_activity(beer):
+    if beer is None:
+        return None
+    dated = beer[beer["Trip Date"].notna()]
+    activity = pd.DataFrame({
+        "Day": dated["Trip Date"].dt.normalize(),
+        "Trip Status": dated["Trip Status"],
+        "Pickup": trip_locations(dated, "Pickup"),
+        "Dropoff": trip_locations(dated, "Dropoff"),
+        "trips": np.ones(len(dated), dtype="int32"),
+    }).groupby(LOCATION_KEYS, observed=True).sum().reset_index()
+    return location_dtypes(activity.sort_values("Day", kind="stable", ignore_index=True))
+
+def merge_location_activity(activity, new_activity):
+    merged = pd.concat([activity, new_activity], ignore_index=True)[LOCATION_KEYS + ["trips"]]
+    merged = merged.groupby(LOCATION_KEYS, observed=True, sort=False).sum().reset_index()
+    return location_dtypes(merged.sort_values("Day", kind="stable", ignore_index=True))
+
+@functools.lru_cache(maxsize=1)
+def town_zones():
+    if not LOCATION_ZONES_FILE:
+        return {}
+    zones = pd.read_csv(LOCATION_ZONES_FILE, dtype=str).dropna(subset=["Town", "Zone"])
+    return dict(zip(normalize_names(zones["Town"]), zones["Zone"].str.strip()))
+
+def location_zones(labels):
+    # Zone of each location label: the town (last address part without plus code or postcode), or the
+    # zone LOCATION_ZONES_FILE groups that town into
+    towns = (pd.Series(labels, dtype="str").str.rsplit(", ", n=1).str[-1]
+             .str.replace(PLUS_CODE, "", regex=True).str.replace(r"\s*\d+$", "", regex=True).str.strip(" ,"))
+    towns = towns.mask(towns == "", "Unknown")
+    zones = town_zones()
+    return normalize_names(towns).map(zones).fillna(towns) if zones else towns
+
+def location_counts(location_rows, role):
+    # Trips per place of a selection, busiest first, as bincounts over the location codes
+    places = location_rows[role].cat
+    counts = np.bincount(places.codes.to_numpy(), weights=location_rows["trips"].to_numpy(dtype=float),
+                         minlength=len(places.categories)).astype("int64")
+    counts = pd.Series(counts, index=pd.Index(places.categories, name=LOCATION_COLUMNS[role][0]), name="count")
+    return counts[counts > 0].sort_values(ascending=False, kind="stable")
+
+def od_matrix(location_rows, size=None):
+    # Trips from each pickup zone (rows) to each dropoff zone (columns), limited to the busiest zones
+    size = OD_MATRIX_SIZE if size is None else size
+    zones = {role: location_rows[f"{role} Zone"].cat for role in ("Pickup", "Dropoff")}
+    zone_names = zones["Pickup"].categories.union(zones["Dropoff"].categories)
+    codes = {role: zone_names.get_indexer(role_zones.categories)[role_zones.codes.to_numpy()] for role, role_zones in zones.items()}
+    n = len(zone_names)
+    matrix = np.bincount(codes["Pickup"] * n + codes["Dropoff"], weights=location_rows["trips"].to_numpy(dtype=float),
+                         minlength=n * n).reshape(n, n).astype("int64")
+    busiest = np.argsort(-(matrix.sum(axis=0) + matrix.sum(axis=1)), kind="stable")
+    keep, rest = np.sort(busiest[:size]), busiest[size:]
+    labels = list(zone_names[keep])
+    if len(rest):
+        # Fold the quieter zones into one "Other" row and column
+        matrix = np.vstack([matrix[keep], matrix[rest].sum(axis=0)])
+        matrix = np.column_stack([matrix[:, keep], matrix[:, rest].sum(axis=1)])
+        labels.append("Other")
+    else:
+        matrix = matrix[np.ix_(keep, keep)]
+    return pd.DataFrame(matrix, index=pd.Index(labels, name="From Zone"), columns=pd.Index(labels, name="To Zone"))
+
+DERIVED_BUILDERS = {
+    "daily_rollup": build_daily_rollup,
+    "staff_index": build_staff_index,
+    "staff_trips": build_staff_trips,
+    "entity_activity": build_entity_activity,
+    "user_cohorts": build_user_cohorts,
+    "location_activity": build_location_activity,
+}
+# Derived tables that can be updated from newly appended trips alone
+DERIVED_MERGERS = {
+    "daily_rollup": merge_rollups,
+    "entity_activity": merge_activity,
+    "location_activity": merge_location_activity,
+}
+
+TRIP_TOTAL_KEYS = ["trips", "completed_trips", "cancelled_trips", "expired_trips", "pay_sum", "commission_sum",
+                   "distance_sum", "completed_pay_sum", "completed_distance_sum"]
+
+def trip_totals(df, rollup_rows=None):
+    # Counts and sums for a filtered selection; summing rollup rows avoids touching the trips
+    if rollup_rows is None:
+        rollup_rows = build_daily_rollup(df)
+    if rollup_rows is None:
+        return dict.fromkeys(TRIP_TOTAL_KEYS, 0)
+    status = rollup_rows["Trip Status"]
+    completed = rollup_rows[status == "Job Completed"]
+    return {
+        "trips": int(rollup_rows["trips"].sum()),
+        "completed_trips": int(completed["trips"].sum()),
+        "cancelled_trips": int(rollup_rows.loc[status.str.contains("Cancel", na=False), "trips"].sum()),
+        "expired_trips": int(rollup_rows.loc[status == "Expired", "trips"].sum()),
+        "pay_sum": rollup_rows["pay_sum"].sum(),
+        "commission_sum": rollup_rows["commission_sum"].sum(),
+        "distance_sum": rollup_rows["distance_sum"].sum(),
+        "completed_pay_sum": completed["pay_sum"].sum(),
+        "completed_distance_sum": completed["distance_sum"].sum(),
+    }
+
 def format_int(value):
     try:
         return f"{int(round(value)):,}"
@@ -181,21 +1585,31 @@ def format_percent(value, decimals=1):
         return "N/A"
 
 # KPI calculations for Overview tab
-def calculate_overview_kpis(beer, passengers, drivers, start_date, end_date, selected_statuses):
-    df = filter_data_by_date_and_status(beer, start_date, end_date, selected_statuses)
-    total_requests = len(df) if df is not None else 0
-    completed_trips = len(df[df["Trip Status"] == "Job Completed"]) if df is not None else 0
-    avg_distance = df["Trip Distance (KM/Mi)"].mean() if df is not None and not df.empty else 0
-    driver_cancellations = df["Trip Status"].str.contains("Cancel", na=False).sum() if df is not None else 0
-    passenger_search_timeout = (df["Trip Status"] == "Expired").sum() if df is not None else 0
+@instrumented()
+def calculate_overview_kpis(beer, passengers, drivers, start_date, end_date, selected_statuses, filtered_df=None, rollup_rows=None,
+                            aggregates=None, entity_totals=None):
+    df = filtered_df if filtered_df is not None else filter_data_by_date_and_status(beer, start_date, end_date, selected_statuses)
+    totals = trip_totals(df, rollup_rows)
+    total_requests = totals["trips"]
+    completed_trips = totals["completed_trips"]
+    avg_distance = totals["distance_sum"] / total_requests if total_requests > 0 else 0
+    driver_cancellations = totals["cancelled_trips"]
+    passenger_search_timeout = totals["expired_trips"]
     driver_cancellation_rate = (driver_cancellations / total_requests * 100) if total_requests > 0 else None
     passenger_search_timeout_rate = (passenger_search_timeout / total_requests * 100) if total_requests > 0 else None
-    avg_trips_per_driver = df.groupby("Driver").size().mean() if df is not None and not df.empty else None
-    passenger_app_downloads = len(passengers[(passengers["Created"] >= pd.to_datetime(start_date)) & (passengers["Created"] <= pd.to_datetime(end_date))]) if passengers is not None else 0
-    riders_onboarded = len(drivers[(drivers["Created"] >= pd.to_datetime(start_date)) & (drivers["Created"] <= pd.to_datetime(end_date))]) if drivers is not None else 0
-    total_distance_covered = df[df["Trip Status"] == "Job Completed"]["Trip Distance (KM/Mi)"].sum() if df is not None else 0
-    avg_revenue_per_trip = df["Trip Pay Amount"].mean() if df is not None and not df.empty else 0
-    total_commission = df["Company Commission Cleaned"].sum() if df is not None else 0
+    if aggregates is not None:
+        driver_trips = aggregates["counts"]["Driver"]
+        avg_trips_per_driver = driver_trips[driver_trips > 0].mean() if driver_trips.any() else None
+    elif entity_totals is not None:
+        driver_trips = role_totals(entity_totals, "Driver")["trips"]
+        avg_trips_per_driver = driver_trips.mean() if len(driver_trips) else None
+    else:
+        avg_trips_per_driver = df.groupby("Driver", observed=True).size().mean() if df is not None and not df.empty else None
+    passenger_app_downloads = count_created_between(passengers, start_date, end_date) if passengers is not None else 0
+    riders_onboarded = count_created_between(drivers, start_date, end_date) if drivers is not None else 0
+    total_distance_covered = totals["completed_distance_sum"]
+    avg_revenue_per_trip = totals["pay_sum"] / total_requests if total_requests > 0 else 0
+    total_commission = totals["commission_sum"]
     return {
         "total_requests": total_requests,
         "completed_trips": completed_trips,
@@ -211,24 +1625,36 @@ def calculate_overview_kpis(beer, passengers, drivers, start_date, end_date, sel
         "filtered_df": df,
     }
 
-def calculate_financial_kpis(beer, passengers, drivers, start_date, end_date, selected_statuses):
-    df = filter_data_by_date_and_status(beer, start_date, end_date, selected_statuses)
+@instrumented()
+def calculate_financial_kpis(beer, passengers, drivers, start_date, end_date, selected_statuses, filtered_df=None, rollup_rows=None,
+                             aggregates=None, entity_totals=None):
+    df = filtered_df if filtered_df is not None else filter_data_by_date_and_status(beer, start_date, end_date, selected_statuses)
     if df is None or df.empty:
         return {}
-    total_value_of_rides = df[df["Trip Status"] == "Job Completed"]["Trip Pay Amount"].sum()
-    total_commission = df["Company Commission Cleaned"].sum()
+    totals = trip_totals(df, rollup_rows)
+    total_value_of_rides = totals["completed_pay_sum"]
+    total_commission = totals["commission_sum"]
     gross_profit = total_commission
     passenger_wallet_balance = passengers["Wallet Balance"].sum() if passengers is not None else 0
     driver_wallet_balance = drivers[drivers["Wallet Balance"] > 0]["Wallet Balance"].sum() if drivers is not None else 0
     commission_owed = drivers[drivers["Wallet Balance"] < 0]["Wallet Balance"].abs().sum() if drivers is not None else 0
-    avg_commission_per_trip = df["Company Commission Cleaned"].mean()
-    avg_revenue_per_driver = df.groupby("Driver")["Trip Pay Amount"].sum().mean()
-    avg_driver_earnings_per_trip = (df["Trip Pay Amount"] - df["Company Commission Cleaned"]).mean()
-    completed_trips = df[df["Trip Status"] == "Job Completed"]
-    if not completed_trips.empty:
-        fare_per_km = (completed_trips["Trip Pay Amount"] / completed_trips["Trip Distance (KM/Mi)"].replace(0,1)).mean()
+    avg_commission_per_trip = total_commission / totals["trips"]
+    avg_driver_earnings_per_trip = (totals["pay_sum"] - total_commission) / totals["trips"]
+    if aggregates is not None:
+        driver_trips = aggregates["counts"]["Driver"]
+        avg_revenue_per_driver = aggregates["driver_pay"][driver_trips > 0].mean()
+        fare_sum, fare_count = aggregates["fare_per_km"]
+        fare_per_km = fare_sum / fare_count if fare_count else (np.nan if totals["completed_trips"] else 0)
     else:
-        fare_per_km = 0
+        if entity_totals is not None:
+            avg_revenue_per_driver = role_totals(entity_totals, "Driver")["pay_sum"].mean()
+        else:
+            avg_revenue_per_driver = df.groupby("Driver", observed=True)["Trip Pay Amount"].sum().mean()
+        completed_trips = df[df["Trip Status"] == "Job Completed"]
+        if not completed_trips.empty:
+            fare_per_km = (completed_trips["Trip Pay Amount"] / completed_trips["Trip Distance (KM/Mi)"].replace(0,1)).mean()
+        else:
+            fare_per_km = 0
     revenue_share = (total_commission / total_value_of_rides * 100) if total_value_of_rides > 0 else 0
     return {
         "total_value_of_rides": total_value_of_rides,
@@ -245,40 +1671,84 @@ def calculate_financial_kpis(beer, passengers, drivers, start_date, end_date, se
         "filtered_df": df,
     }
 
-def calculate_user_analysis_kpis(beer, passengers, drivers, union_staff_names, start_date, end_date, selected_statuses):
-    df = filter_data_by_date_and_status(beer, start_date, end_date, selected_statuses)
-    unique_drivers = df["Driver"].nunique() if df is not None else 0
-    passenger_app_downloads = len(passengers[(passengers["Created"] >= pd.to_datetime(start_date)) & (passengers["Created"] <= pd.to_datetime(end_date))]) if passengers is not None else 0
-    riders_onboarded = len(drivers[(drivers["Created"] >= pd.to_datetime(start_date)) & (drivers["Created"] <= pd.to_datetime(end_date))]) if drivers is not None else 0
+@instrumented()
+def calculate_user_analysis_kpis(beer, passengers, drivers, union_staff_names, start_date, end_date, selected_statuses, filtered_df=None,
+                                 aggregates=None, staff_trips=None, entity_totals=None, cohorts=None):
+    df = filtered_df if filtered_df is not None else filter_data_by_date_and_status(beer, start_date, end_date, selected_statuses)
+    if aggregates is not None:
+        unique_drivers = int(np.count_nonzero(aggregates["counts"]["Driver"]))
+    elif entity_totals is not None:
+        unique_drivers = len(role_totals(entity_totals, "Driver"))
+    else:
+        unique_drivers = df["Driver"].nunique() if df is not None else 0
+    passenger_app_downloads = count_created_between(passengers, start_date, end_date) if passengers is not None else 0
+    riders_onboarded = count_created_between(drivers, start_date, end_date) if drivers is not None else 0
     driver_retention_rate = (unique_drivers / riders_onboarded * 100) if riders_onboarded > 0 else 0
     passenger_to_driver_ratio = (passenger_app_downloads / unique_drivers) if unique_drivers > 0 else 0
-    # Union staff trips table
-    if df is not None and union_staff_names:
-        staff_trips = df[(df["Passenger"].isin(union_staff_names)) & (df["Trip Status"] == "Job Completed")]
-        staff_trips_table = staff_trips[["Passenger", "Trip Date", "Trip Pay Amount", "Trip Distance (KM/Mi)"]].copy()
-        staff_trips_table.rename(columns={"Trip Pay Amount": "Trip Pay Amount (UGX)", "Trip Distance (KM/Mi)": "Distance"}, inplace=True)
+    # Union staff trips table: a date-range slice of the precomputed staff trips, otherwise the staff
+    # index is built over the selection
+    if staff_trips is not None:
+        if selected_statuses and "Job Completed" not in selected_statuses:
+            staff_trips = staff_trips.iloc[:0]
+        else:
+            staff_trips = staff_trips.iloc[trip_date_slice(staff_trips, start_date, end_date)]
+    elif df is not None and union_staff_names:
+        staff_trips = build_staff_trips(df, build_staff_index(df, pd.DataFrame({"Union Staff": union_staff_names})))
+    if staff_trips is not None and not staff_trips.empty:
+        staff_trips_table = staff_trips[["Union Staff", "Passenger", "Trip Date", "Trip Pay Amount", "Trip Distance (KM/Mi)"]].rename(
+            columns={"Trip Pay Amount": "Trip Pay Amount (UGX)", "Trip Distance (KM/Mi)": "Distance"}).reset_index(drop=True)
+        staff_summary = staff_trips.groupby("Union Staff").agg(**{
+            "Completed Trips": ("Trip Date", "size"),
+            "Trip Pay Amount (UGX)": ("Trip Pay Amount", "sum"),
+            "Distance": ("Trip Distance (KM/Mi)", "sum"),
+        }).sort_values("Completed Trips", ascending=False)
     else:
         staff_trips_table = pd.DataFrame()
-    return {
+        staff_summary = pd.DataFrame()
+    kpis = {
         "unique_drivers": unique_drivers,
         "passenger_app_downloads": passenger_app_downloads,
         "riders_onboarded": riders_onboarded,
         "driver_retention_rate": driver_retention_rate,
         "passenger_to_driver_ratio": passenger_to_driver_ratio,
         "staff_trips_table": staff_trips_table,
+        "staff_summary": staff_summary,
         "filtered_df": df,
     }
+    if cohorts is not None:
+        kpis.update(activation_kpis(cohorts, start_date, end_date))
+    return kpis
 
-def calculate_geographic_kpis(beer, start_date, end_date, selected_statuses):
-    df = filter_data_by_date_and_status(beer, start_date, end_date, selected_statuses)
+@instrumented()
+def calculate_geographic_kpis(beer, start_date, end_date, selected_statuses, filtered_df=None, rollup_rows=None, aggregates=None,
+                              location_rows=None):
+    # With location_rows (the selection's location_activity rows) places are normalized and counted
+    # from the location dimension, and the origin-destination matrix is added
+    df = filtered_df if filtered_df is not None else filter_data_by_date_and_status(beer, start_date, end_date, selected_statuses)
     if df is None or df.empty:
         return {}
-    top_pickup = df["Pickup Location"].value_counts().head(5)
-    top_dropoff = df["Dropoff Location"].value_counts().head(5)
-    df["Trip Hour"] = df["Trip Date"].dt.hour
-    peak_hours = df["Trip Hour"].value_counts().sort_index()
-    trip_status_trends = df.groupby([df["Trip Date"].dt.date, "Trip Status"]).size().unstack(fill_value=0)
-    customer_payment_methods = df["Pay Mode"].value_counts()
+    locations = {}
+    if location_rows is not None:
+        locations = {
+            "top_pickup": location_counts(location_rows, "Pickup").head(5),
+            "top_dropoff": location_counts(location_rows, "Dropoff").head(5),
+            "od_matrix": od_matrix(location_rows),
+        }
+    if aggregates is not None:
+        return {**geographic_kpis_from_aggregates(df, aggregates, rollup_rows), **locations}
+    if locations:
+        top_pickup, top_dropoff = locations["top_pickup"], locations["top_dropoff"]
+    else:
+        # value_counts on a categorical also lists unused categories, drop those
+        top_pickup = df["Pickup Location"].value_counts()[lambda counts: counts > 0].head(5)
+        top_dropoff = df["Dropoff Location"].value_counts()[lambda counts: counts > 0].head(5)
+    peak_hours = df["Trip Date"].dt.hour.rename("Trip Hour").value_counts().sort_index()
+    if rollup_rows is not None:
+        trip_status_trends = (rollup_rows.groupby([rollup_rows["Day"].dt.date.rename("Trip Date"), "Trip Status"], observed=True)["trips"]
+                              .sum().unstack(fill_value=0))
+    else:
+        trip_status_trends = df.groupby([df["Trip Date"].dt.date, "Trip Status"], observed=True).size().unstack(fill_value=0)
+    customer_payment_methods = df["Pay Mode"].value_counts()[lambda counts: counts > 0]
     return {
         "top_pickup": top_pickup,
         "top_dropoff": top_dropoff,
@@ -286,34 +1756,482 @@ def calculate_geographic_kpis(beer, start_date, end_date, selected_statuses):
         "trip_status_trends": trip_status_trends,
         "customer_payment_methods": customer_payment_methods,
         "filtered_df": df,
+        **locations,
+    }
+
+# Parallel KPI engine: the filtered trips (sorted by Trip Date) are cut into calendar months, each month
+# is reduced to small partial aggregates in a forked worker and the partials are merged. Days never
+# span two months, so daily figures are exact; distinct drivers are exact too, counted per category code.
+PARTIAL_CATEGORIES = ["Driver", "Pickup Location", "Dropoff Location", "Pay Mode"]
+# Set only inside pool workers, each pool's own frame
+_PARTITION_SOURCE = None
+
+def supports_partials(df):
+    return all(isinstance(df[col].dtype, pd.CategoricalDtype) for col in PARTIAL_CATEGORIES + ["Trip Status"])
+
+def month_partitions(df):
+    dates = df["Trip Date"].to_numpy()
+    months = pd.date_range(df["Trip Date"].iloc[0].to_period("M").to_timestamp(), df["Trip Date"].iloc[-1], freq="MS")
+    bounds = [0, *np.searchsorted(dates, months[1:].to_numpy().astype(dates.dtype)), len(df)]
+    return [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+def category_counts(series):
+    codes = series.cat.codes.to_numpy()
+    return np.bincount(codes[codes >= 0], minlength=len(series.cat.categories))
+
+def trip_partials(df):
+    pay = df["Trip Pay Amount"].to_numpy(dtype=float, na_value=np.nan)
+    distance = df["Trip Distance (KM/Mi)"].to_numpy(dtype=float, na_value=np.nan)
+    completed = (df["Trip Status"] == "Job Completed").to_numpy()
+    fare_per_km = pay[completed] / np.where(distance[completed] == 0, 1, distance[completed])
+    drivers = df["Driver"].cat.codes.to_numpy()
+    has_driver = drivers >= 0
+    return {
+        "daily": daily_aggregates(df),
+        "trends": df.groupby([df["Trip Date"].dt.normalize(), "Trip Status"], observed=True).size(),
+        "hours": np.bincount(df["Trip Date"].dt.hour.to_numpy(), minlength=24),
+        "counts": {col: category_counts(df[col]) for col in PARTIAL_CATEGORIES},
+        "driver_pay": np.bincount(drivers[has_driver], weights=np.nan_to_num(pay[has_driver]),
+                                  minlength=len(df["Driver"].cat.categories)),
+        "fare_per_km": (np.nansum(fare_per_km), np.count_nonzero(~np.isnan(fare_per_km))),
+    }
+
+def merge_trip_partials(parts):
+    return {
+        # Months never share a day, so the per-day frames just stack up
+        "daily": pd.concat([part["daily"] for part in parts]),
+        "trends": pd.concat([part["trends"] for part in parts]),
+        "hours": sum(part["hours"] for part in parts),
+        "counts": {col: sum(part["counts"][col] for part in parts) for col in PARTIAL_CATEGORIES},
+        "driver_pay": sum(part["driver_pay"] for part in parts),
+        "fare_per_km": tuple(sum(values) for values in zip(*(part["fare_per_km"] for part in parts))),
+    }
+
+def _set_partition_source(df):
+    global _PARTITION_SOURCE
+    _PARTITION_SOURCE = df
+
+def _partials_for_rows(bounds):
+    start, stop = bounds
+    return trip_partials(_PARTITION_SOURCE.iloc[start:stop])
+
+@instrumented()
+def trip_aggregates(df, workers=None):
+    # Forked workers inherit the frame through the pool initializer instead of receiving a pickled copy
+    # of it; concurrent sessions each fork their own pool, so they never see each other's frame
+    workers = KPI_WORKERS if workers is None else workers
+    partitions = month_partitions(df)
+    if workers <= 1 or len(partitions) <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return merge_trip_partials([trip_partials(df.iloc[start:stop]) for start, stop in partitions])
+    with ProcessPoolExecutor(max_workers=min(workers, len(partitions)), mp_context=multiprocessing.get_context("fork"),
+                             initializer=_set_partition_source, initargs=(df,)) as pool:
+        parts = list(pool.map(_partials_for_rows, partitions))
+    return merge_trip_partials(parts)
+
+def category_value_counts(df, col, counts):
+    # Same shape as df[col].value_counts() with unused categories dropped
+    categories = df[col].cat.categories
+    series = pd.Series(counts, index=pd.CategoricalIndex(categories, categories=categories, name=col), name="count")
+    return series.sort_values(ascending=False)[lambda values: values > 0]
+
+def geographic_kpis_from_aggregates(df, aggregates, rollup_rows=None):
+    counts = aggregates["counts"]
+    hours = pd.Series(aggregates["hours"], index=pd.RangeIndex(24, name="Trip Hour"), name="count")
+    if rollup_rows is not None:
+        trip_status_trends = (rollup_rows.groupby([rollup_rows["Day"].dt.date.rename("Trip Date"), "Trip Status"], observed=True)["trips"]
+                              .sum().unstack(fill_value=0))
+    else:
+        trends = aggregates["trends"]
+        trip_status_trends = trends.set_axis(trends.index.set_levels(trends.index.levels[0].date, level=0)).unstack(fill_value=0)
+    return {
+        "top_pickup": category_value_counts(df, "Pickup Location", counts["Pickup Location"]).head(5),
+        "top_dropoff": category_value_counts(df, "Dropoff Location", counts["Dropoff Location"]).head(5),
+        "peak_hours": hours[hours > 0],
+        "trip_status_trends": trip_status_trends,
+        "customer_payment_methods": category_value_counts(df, "Pay Mode", counts["Pay Mode"]),
+        "filtered_df": df,
     }
 
-def generate_excel_export(df):
-    # Generate daily metrics DataFrame as specified
+# Chart data layer: figures are built from server-side aggregates (counts per status, per day, pre-binned
+# histograms), never from per-trip rows, and no chart gets more than MAX_CHART_POINTS points
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keep the first and last points and, from each bucket in between, the
+    # point that makes the largest triangle with the last kept point and the next bucket's average
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = [0]
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_start, next_stop = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[next_start:next_stop].mean(), y[next_start:next_stop].mean()
+        prev = keep[-1]
+        area = np.abs((x[prev] - avg_x) * (y[start:stop] - y[prev]) - (x[prev] - x[start:stop]) * (avg_y - y[prev]))
+        keep.append(start + int(area.argmax()))
+    keep.append(n - 1)
+    return np.array(keep)
+
+def downsample_series(series, max_points=None):
+    max_points = MAX_CHART_POINTS if max_points is None else max_points
+    if len(series) <= max_points:
+        return series
+    x = pd.DatetimeIndex(series.index).asi8 if not pd.api.types.is_numeric_dtype(series.index) else series.index.to_numpy()
+    return series.iloc[lttb_indices(x, series.to_numpy(dtype=float), max_points)]
+
+def downsample_frame(frame, max_points=None):
+    # One line per column, sharing the chart's point budget; returned in long form for px.line(color=...)
+    max_points = MAX_CHART_POINTS if max_points is None else max_points
+    per_line = max(max_points // max(len(frame.columns), 1), 3)
+    columns = frame.columns.name or "series"
+    parts = [downsample_series(frame[col], per_line).rename("value").rename_axis("x").reset_index().assign(**{columns: col})
+             for col in frame.columns]
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=["x", "value", columns])
+
+@instrumented()
+def chart_data(df, rollup_rows=None, aggregates=None, entity_totals=None):
     if df is None or df.empty:
+        return {}
+    if rollup_rows is None:
+        rollup_rows = build_daily_rollup(df)
+    status_counts = rollup_rows.groupby("Trip Status", observed=True)["trips"].sum()
+    if aggregates is not None:
+        driver_trips = aggregates["counts"]["Driver"]
+        driver_trips = driver_trips[driver_trips > 0]
+    elif entity_totals is not None:
+        driver_trips = role_totals(entity_totals, "Driver")["trips"].to_numpy()
+    else:
+        driver_trips = df.groupby("Driver", observed=True).size().to_numpy()
+    drivers, bin_edges = np.histogram(driver_trips, bins=TRIPS_PER_DRIVER_BINS)
+    return {
+        "status_counts": status_counts[status_counts > 0],
+        "trips_over_time": downsample_series(rollup_rows.groupby("Day")["trips"].sum()),
+        "revenue_by_pay_mode": rollup_rows.groupby("Pay Mode", observed=True)["commission_sum"].sum(),
+        "trips_per_driver": pd.DataFrame({"trips_from": bin_edges[:-1], "trips_to": bin_edges[1:], "drivers": drivers}),
+    }
+
+def figure_points(fig):
+    if fig.data and fig.data[0].type == "heatmap":
+        return sum(np.size(trace.z) for trace in fig.data)
+    if fig.data and fig.data[0].type == "pie":
+        return sum(len(trace.values if trace.values is not None else trace.labels) for trace in fig.data)
+    return sum(len(trace.x if trace.x is not None else trace.y) for trace in fig.data)
+
+def show_chart(fig):
+    # Figure serialization happens inside st.plotly_chart
+    with perf_stage(f"plotly: {fig.layout.title.text}") as record:
+        st.plotly_chart(fig, use_container_width=True)
+        if record:
+            record["rows"] = figure_points(fig)
+
+# Figure builders import plotly.express when the first chart is drawn, not when the app starts
+def trip_status_figure(charts):
+    import plotly.express as px
+    counts = charts["status_counts"]
+    return px.pie(values=counts.values, names=counts.index.astype(str), title="Trip Status Distribution")
+
+def trips_over_time_figure(charts):
+    import plotly.express as px
+    daily = charts["trips_over_time"]
+    return px.line(x=daily.index, y=daily.values, title="Trips Over Time", labels={"x": "Date", "y": "Number of Trips"})
+
+def revenue_by_pay_mode_figure(charts):
+    import plotly.express as px
+    revenue = charts["revenue_by_pay_mode"]
+    return px.pie(values=revenue.values, names=revenue.index.astype(str), title="Revenue Share by Payment Mode")
+
+def trips_per_driver_figure(charts):
+    import plotly.express as px
+    bins = charts["trips_per_driver"]
+    fig = px.bar(x=(bins["trips_from"] + bins["trips_to"]) / 2, y=bins["drivers"], title="Trips per Driver Distribution",
+                 labels={"x": "Trips per Driver", "y": "Drivers"})
+    return fig.update_traces(width=(bins["trips_to"] - bins["trips_from"]).to_numpy())
+
+def peak_hours_figure(geo):
+    import plotly.express as px
+    return px.bar(x=geo["peak_hours"].index, y=geo["peak_hours"].values, labels={"x": "Hour of Day", "y": "Number of Trips"}, title="Peak Trip Hours")
+
+def status_trends_figure(geo):
+    import plotly.express as px
+    trends = downsample_frame(geo["trip_status_trends"])
+    return px.line(trends, x="x", y="value", color=trends.columns[-1], title="Trip Status Trends Over Time",
+                   labels={"x": "Trip Date", "value": "Number of Trips"})
+
+def od_heatmap_figure(geo):
+    import plotly.express as px
+    matrix = geo["od_matrix"]
+    return px.imshow(matrix, labels={"x": "Dropoff Zone", "y": "Pickup Zone", "color": "Trips"}, aspect="auto",
+                     color_continuous_scale="Blues", title="Trips Between Zones")
+
+def payment_methods_figure(geo):
+    import plotly.express as px
+    return px.pie(values=geo["customer_payment_methods"].values, names=geo["customer_payment_methods"].index, title="Customer Payment Methods")
+
+# Per-rerun analysis context
+_UNSET = object()
+
+def result_nbytes(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum()) if isinstance(value, pd.DataFrame) else int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sum(result_nbytes(v) for v in value.values()) + sys.getsizeof(value)
+    return sys.getsizeof(value)
+
+class KPIResultCache:
+    # KPI results shared by every session of this server process, keyed by
+    # (snapshot version, start_date, end_date, frozenset(statuses), metric group). Results are treated as
+    # read-only; least recently used entries are evicted past max_entries or max_bytes.
+    def __init__(self, max_entries, max_bytes, version=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = version
+        # The next snapshot's version while it is warmed, before it is swapped in
+        self.incoming = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+        # Computed outside the lock so one slow group doesn't block other sessions
+        value = compute()
+        size = result_nbytes(value)
+        with self._lock:
+            if key[0] not in (self.version, self.incoming) or size > self.max_bytes or key in self._entries:
+                return value
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def accept(self, version):
+        # Let a snapshot that is not served yet store its results, so it can be warmed before the swap
+        with self._lock:
+            self.incoming = version
+
+    def invalidate(self, version):
+        # Called when a new snapshot is swapped in: results for older versions can never be hit again,
+        # the ones computed for it while it was warmed are kept
+        with self._lock:
+            self.version = version
+            self.incoming = None
+            for key in [key for key in self._entries if key[0] != version]:
+                self.nbytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "megabytes": round(self.nbytes / 1024 / 1024, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+class AnalysisContext:
+    # One filter selection (start_date, end_date, selected_statuses) for one rerun: the trips table is
+    # filtered once and every tab, chart and export reads the same frame and the same KPI dicts
+    def __init__(self, beer, passengers, drivers, union_staff_names, start_date, end_date, selected_statuses, daily_rollup=None,
+                 snapshot_version=None, kpi_cache=None, staff_trips=None, entity_activity=None, user_cohorts=None,
+                 location_activity=None, trip_store=None):
+        self.beer = beer
+        self.daily_rollup = daily_rollup
+        self.staff_trips = staff_trips
+        self.entity_activity = entity_activity
+        self.user_cohorts = user_cohorts
+        self.location_activity = location_activity
+        # With a trip store, beer is None and the selection is queried from the store
+        self.trip_store = trip_store
+        self.passengers = passengers
+        self.drivers = drivers
+        self.union_staff_names = union_staff_names
+        self.start_date = start_date
+        self.end_date = end_date
+        self.selected_statuses = list(selected_statuses)
+        self.key = (snapshot_version, start_date, end_date, frozenset(self.selected_statuses))
+        self.kpi_cache = kpi_cache
+        self.trip_scans = 0
+        self._filtered_df = _UNSET
+        self._results = {}
+
+    @property
+    def filtered_df(self):
+        if self._filtered_df is _UNSET:
+            if self.trip_store is not None:
+                self._filtered_df = self.trip_store.select(self.start_date, self.end_date, self.selected_statuses)
+            else:
+                self._filtered_df = filter_data_by_date_and_status(self.beer, self.start_date, self.end_date, self.selected_statuses)
+            self.trip_scans += 1
+        return self._filtered_df
+
+    @property
+    def rollup_rows(self):
+        if self.daily_rollup is None:
+            return None
+        return self._memoized("rollup_rows", lambda: filter_data_by_date_and_status(
+            self.daily_rollup, self.start_date, self.end_date, self.selected_statuses, date_column="Day"))
+
+    @property
+    def activity_rows(self):
+        if self.entity_activity is None:
+            return None
+        return self._memoized("activity_rows", lambda: filter_data_by_date_and_status(
+            self.entity_activity, self.start_date, self.end_date, self.selected_statuses, date_column="Day"))
+
+    @property
+    def location_rows(self):
+        if self.location_activity is None:
+            return None
+        return self._memoized("location_rows", lambda: filter_data_by_date_and_status(
+            self.location_activity, self.start_date, self.end_date, self.selected_statuses, date_column="Day"))
+
+    @property
+    def entity_totals(self):
+        # Per driver and passenger totals of the selection, shared by every metric group that needs them
+        if self.activity_rows is None:
+            return None
+        return self._memoized("entity_totals", lambda: entity_totals(self.activity_rows))
+
+    def _memoized(self, name, compute):
+        if name not in self._results:
+            self._results[name] = compute()
+        return self._results[name]
+
+    @property
+    def aggregates(self):
+        # Month-partitioned partial aggregates, only worth it for large selections with UNION_KPI_WORKERS > 1
+        if KPI_WORKERS <= 1:
+            return None
+        def compute():
+            df = self.filtered_df
+            if df is None or df.empty or len(df) < PARALLEL_MIN_ROWS or not supports_partials(df):
+                return None
+            return trip_aggregates(df)
+        return self._memoized("aggregates", compute)
+
+    def _shared(self, group, compute):
+        # Metric groups go through the cross-session KPI cache; the filtered frame itself is not cached,
+        # callers that need it read ctx.filtered_df
+        def compute_group():
+            result = compute()
+            if isinstance(result, dict):
+                result = {k: v for k, v in result.items() if k != "filtered_df"}
+            return result
+        if self.kpi_cache is None:
+            return self._memoized(group, compute_group)
+        return self._memoized(group, lambda: self.kpi_cache.get_or_compute(self.key + (group,), compute_group))
+
+    def overview_kpis(self):
+        return self._shared("overview", lambda: calculate_overview_kpis(
+            self.beer, self.passengers, self.drivers, self.start_date, self.end_date, self.selected_statuses,
+            filtered_df=self.filtered_df, rollup_rows=self.rollup_rows, aggregates=self.aggregates, entity_totals=self.entity_totals))
+
+    def financial_kpis(self):
+        return self._shared("financial", lambda: calculate_financial_kpis(
+            self.beer, self.passengers, self.drivers, self.start_date, self.end_date, self.selected_statuses,
+            filtered_df=self.filtered_df, rollup_rows=self.rollup_rows, aggregates=self.aggregates, entity_totals=self.entity_totals))
+
+    def user_kpis(self):
+        return self._shared("user", lambda: calculate_user_analysis_kpis(
+            self.beer, self.passengers, self.drivers, self.union_staff_names, self.start_date, self.end_date, self.selected_statuses,
+            filtered_df=self.filtered_df, aggregates=self.aggregates, staff_trips=self.staff_trips, entity_totals=self.entity_totals,
+            cohorts=self.user_cohorts))
+
+    def geographic_kpis(self):
+        return self._shared("geographic", lambda: calculate_geographic_kpis(
+            self.beer, self.start_date, self.end_date, self.selected_statuses, filtered_df=self.filtered_df, rollup_rows=self.rollup_rows,
+            aggregates=self.aggregates, location_rows=self.location_rows))
+
+    def chart_data(self):
+        return self._shared("charts", lambda: chart_data(self.filtered_df, rollup_rows=self.rollup_rows, aggregates=self.aggregates,
+                                                         entity_totals=self.entity_totals))
+
+    def daily_metrics(self):
+        def compute():
+            if self.trip_store is not None:
+                daily = self.trip_store.daily_aggregates(self.start_date, self.end_date, self.selected_statuses)
+                return generate_excel_export(None, daily=daily)
+            return generate_excel_export(self.filtered_df, aggregates=self.aggregates)
+        return self._shared("daily_metrics", compute)
+
+    def pdf_report(self):
+        # Rendered per request from the cached KPI groups: the PDF carries the time it was generated, so the
+        # bytes themselves are not shared between sessions
+        return generate_pdf_report(self.overview_kpis(), self.financial_kpis(), self.user_kpis(), self.geographic_kpis())
+
+def daily_aggregates(df):
+    # Every daily export column in one grouped pass over the trips
+    status = df["Trip Status"]
+    is_completed = status == "Job Completed"
+    completed_distance = df["Trip Distance (KM/Mi)"].where(is_completed)
+    per_trip = pd.DataFrame({
+        "completed": is_completed,
+        "cancelled": status.str.contains("Cancel", na=False).astype(bool),
+        "completed_pay": df["Trip Pay Amount"].where(is_completed),
+        "completed_distance": completed_distance,
+        "price_per_km": df["Trip Pay Amount"].where(is_completed) / completed_distance.replace(0, 1),
+        "commission": df["Company Commission Cleaned"],
+        "Driver": df["Driver"],
+        "Passenger": df["Passenger"],
+    })
+    return per_trip.groupby(df["Trip Date"].dt.normalize().rename("Trip Date Only"), observed=True).agg(
+        total_value=("completed_pay", "sum"),
+        commissions=("commission", "sum"),
+        completed=("completed", "sum"),
+        requests=("completed", "size"),
+        completed_distance=("completed_distance", "sum"),
+        cancellations=("cancelled", "sum"),
+        price_per_km=("price_per_km", "mean"),
+        active_drivers=("Driver", "nunique"),
+        riders=("Passenger", "nunique"),
+        rider_trips=("Passenger", "count"),
+    )
+
+@instrumented()
+def generate_excel_export(df, aggregates=None, daily=None):
+    # Generate daily metrics DataFrame as specified; daily, if given, is daily_aggregates already computed
+    if daily is None:
+        if df is None or df.empty:
+            return None
+        daily = aggregates["daily"] if aggregates is not None else daily_aggregates(df)
+    if daily.empty:
         return None
-    df["Trip Date Only"] = df["Trip Date"].dt.date
-    completed = df[df["Trip Status"] == "Job Completed"]
-    daily_metrics = pd.DataFrame()
-    daily_metrics["Total Value of Rides"] = completed.groupby("Trip Date Only")["Trip Pay Amount"].sum()
-    daily_metrics["Total Rider Commissions"] = df.groupby("Trip Date Only")["Company Commission Cleaned"].sum()
-    daily_metrics["Total # of Rides Completed"] = completed.groupby("Trip Date Only").size()
-    daily_metrics["Total Requests"] = df.groupby("Trip Date Only").size()
-    daily_metrics["Average Trip Distance"] = completed.groupby("Trip Date Only")["Trip Distance (KM/Mi)"].mean()
+    daily_metrics = pd.DataFrame(index=daily.index.date)
+    daily_metrics.index.name = "Trip Date Only"
+    daily_metrics["Total Value of Rides"] = daily["total_value"].to_numpy()
+    daily_metrics["Total Rider Commissions"] = daily["commissions"].to_numpy()
+    daily_metrics["Total # of Rides Completed"] = daily["completed"].to_numpy()
+    daily_metrics["Total Requests"] = daily["requests"].to_numpy()
+    daily_metrics["Average Trip Distance"] = (daily["completed_distance"] / daily["completed"]).to_numpy()
     # Cancellation rate = count cancellations / total requests
-    cancellations = df[df["Trip Status"].str.contains("Cancel", na=False)]
-    cancellation_rate = 1 - (cancellations.groupby("Trip Date Only").size() / daily_metrics["Total Requests"])
-    daily_metrics["Completion Rate"] = cancellation_rate.fillna(1) * 100
-    daily_metrics["Average Customer Price per Ride"] = completed.groupby("Trip Date Only")["Trip Pay Amount"].mean()
-    daily_metrics["Average Customer Price per Kilometer"] = (completed["Trip Pay Amount"] / completed["Trip Distance (KM/Mi)"].replace(0,1)).groupby(completed["Trip Date Only"]).mean()
-    daily_metrics["Daily Active Drivers"] = df.groupby("Trip Date Only")["Driver"].nunique()
+    daily_metrics["Completion Rate"] = (1 - daily["cancellations"] / daily["requests"]).to_numpy() * 100
+    daily_metrics["Average Customer Price per Ride"] = (daily["total_value"] / daily["completed"]).to_numpy()
+    daily_metrics["Average Customer Price per Kilometer"] = daily["price_per_km"].to_numpy()
+    daily_metrics["Daily Active Drivers"] = daily["active_drivers"].to_numpy()
     # Total Cumulative Riders: cumulative sum of unique passengers up to each day
-    unique_passengers_per_day = df.groupby("Trip Date Only")["Passenger"].nunique()
-    daily_metrics["Total Cumulative Riders"] = unique_passengers_per_day.cumsum()
+    daily_metrics["Total Cumulative Riders"] = daily["riders"].cumsum().to_numpy()
     # Order per Rider: mean number of trips per passenger per day
-    trips_per_passenger_per_day = df.groupby(["Trip Date Only", "Passenger"]).size()
-    order_per_rider = trips_per_passenger_per_day.groupby("Trip Date Only").mean()
-    daily_metrics["Order per Rider"] = order_per_rider
+    daily_metrics["Order per Rider"] = (daily["rider_trips"] / daily["riders"]).to_numpy()
     # Placeholder columns
     placeholders = ["Total Rider Subscriptions", "Average Trip Time", "% of Riders Engaged", "% of Suspended Riders",
                     "Average Rider Earnings", "Daily Online Riders", "Bike Riders Acceptance Rate", "Total Passenger app Downloads Per"]
@@ -322,15 +2240,53 @@ def generate_excel_export(df):
     daily_metrics = daily_metrics.fillna(0)
     return daily_metrics.reset_index()
 
+def export_chunks(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+@instrumented()
 def to_excel_bytes(df):
+    # xlsxwriter's constant_memory mode flushes each row to disk once the next one starts, so rows
+    # are written in order and only one chunk is converted to Python objects at a time
+    import xlsxwriter
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Daily Metrics')
-        writer.save()
-    processed_data = output.getvalue()
-    return processed_data
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True, "default_date_format": "yyyy-mm-dd"})
+    worksheet = workbook.add_worksheet("Daily Metrics")
+    worksheet.write_row(0, 0, [str(col) for col in df.columns], workbook.add_format({"bold": True}))
+    row_num = 1
+    for chunk in export_chunks(df):
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            worksheet.write_row(row_num, 0, row)
+            row_num += 1
+    workbook.close()
+    return output.getvalue()
+
+@instrumented()
+def trips_export_file(df, fmt):
+    # Write the filtered trips chunk by chunk to a temporary file that is removed once it is closed
+    handle = tempfile.TemporaryFile()
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        for chunk in export_chunks(_parquet_safe(df)):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(handle, table.schema)
+            writer.write_table(table)
+        if writer is not None:
+            writer.close()
+    else:
+        for i, chunk in enumerate(export_chunks(df)):
+            handle.write(chunk.to_csv(index=False, header=i == 0).encode("utf-8"))
+    handle.seek(0)
+    return handle
 
-def generate_pdf_report(overview_kpis, financial_kpis, user_kpis, geographic_kpis):
+@instrumented()
+def generate_pdf_report(overview_kpis, financial_kpis, user_kpis, geographic_kpis, period=None):
+    # period, if given, is the (start_date, end_date) the KPIs cover, printed under the title
+    from fpdf import FPDF
     pdf = FPDF()
     pdf.add_page()
     # Add logo
@@ -338,8 +2294,10 @@ def generate_pdf_report(overview_kpis, financial_kpis, user_kpis, geographic_kpi
         pdf.image(str(LOGO_PATH), x=10, y=8, w=33)
     pdf.set_font("Arial", 'B', 16)
     pdf.cell(0, 10, "Union App Metrics Report", ln=True, align='C')
-    pdf.ln(10)
     pdf.set_font("Arial", '', 12)
+    if period is not None:
+        pdf.cell(0, 8, f"{period[0]:%Y-%m-%d} to {period[1]:%Y-%m-%d}", ln=True, align='C')
+    pdf.ln(10)
     # Overview Section
     pdf.cell(0, 10, "Trips Overview", ln=True)
     for k, v in overview_kpis.items():
@@ -357,7 +2315,7 @@ def generate_pdf_report(overview_kpis, financial_kpis, user_kpis, geographic_kpi
     # User Analysis Section
     pdf.cell(0, 10, "User Analysis", ln=True)
     for k, v in user_kpis.items():
-        if k == "filtered_df" or k == "staff_trips_table":
+        if k == "filtered_df" or isinstance(v, pd.DataFrame):
             continue
         pdf.cell(0, 8, f"{k.replace('_', ' ').title()}: {format_float(v) if isinstance(v, float) else format_int(v)}", ln=True)
     pdf.ln(5)
@@ -379,119 +2337,97 @@ def generate_pdf_report(overview_kpis, financial_kpis, user_kpis, geographic_kpi
     pdf.cell(0, 10, f"Generated on {dt.now().strftime('%Y-%m-%d %H:%M:%S')}", align='C')
     return pdf.output(dest='S').encode('latin1')
 
-def main():
-    st.set_page_config(page_title="Union App Metrics Dashboard", layout="wide", page_icon="🚖")
-    # Theme selection
-    theme = st.sidebar.selectbox("Select Theme", options=["Light", "Dark"], index=0)
-    if theme == "Light":
-        st.markdown(LIGHT_THEME_CSS, unsafe_allow_html=True)
-    else:
-        st.markdown(DARK_THEME_CSS, unsafe_allow_html=True)
+def render_overview_tab(ctx):
+    st.header("Trips Overview")
+    overview = ctx.overview_kpis()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Total Requests", format_int(overview["total_requests"]))
+    col2.metric("Completed Trips", format_int(overview["completed_trips"]))
+    col3.metric("Avg Trip Distance (KM/Mi)", format_float(overview["avg_distance"]))
+    col4.metric("Driver Cancellation Rate", format_percent(overview["driver_cancellation_rate"] or 0))
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Passenger Search Timeout Rate", format_percent(overview["passenger_search_timeout_rate"] or 0))
+    col2.metric("Avg Trips per Driver", format_float(overview["avg_trips_per_driver"] or 0))
+    col3.metric("Passenger App Downloads", format_int(overview["passenger_app_downloads"]))
+    col4.metric("Riders Onboarded", format_int(overview["riders_onboarded"]))
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total Distance Covered", format_float(overview["total_distance_covered"]))
+    col2.metric("Avg Revenue per Trip", format_float(overview["avg_revenue_per_trip"]))
+    col3.metric("Total Commission", format_float(overview["total_commission"]))
 
-    # Load data
-    passengers, drivers, beer, transactions, union_staff_names = load_all_data()
-    passengers, drivers, beer, union_staff_names = preprocess_data(passengers, drivers, beer, transactions, union_staff_names)
+    # Visualizations
+    charts = ctx.chart_data()
+    if charts:
+        st.subheader("Trip Status Distribution")
+        show_chart(trip_status_figure(charts))
 
-    # Sidebar filters
-    st.sidebar.header("Filters")
-    min_date = beer["Trip Date"].min() if beer is not None else dt(2020,1,1)
-    max_date = beer["Trip Date"].max() if beer is not None else dt.today()
-    date_range = st.sidebar.date_input("Select Date Range", value=(min_date, max_date), min_value=min_date, max_value=max_date)
-    if len(date_range) != 2:
-        st.sidebar.error("Please select a start and end date.")
-        return
-    start_date, end_date = date_range
-    trip_statuses = beer["Trip Status"].unique().tolist() if beer is not None else []
-    selected_statuses = st.sidebar.multiselect("Select Trip Status", options=trip_statuses, default=trip_statuses)
+        st.subheader("Trips Over Time")
+        show_chart(trips_over_time_figure(charts))
 
-    # Tabs
-    tabs = st.tabs(["Overview", "Financial", "User Analysis", "Geographic", "Export", "Feedback"])
+def render_financial_tab(ctx):
+    st.header("Financial Metrics")
+    financial = ctx.financial_kpis()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total Value of Rides", format_float(financial.get("total_value_of_rides", 0)))
+    col2.metric("Total Commission", format_float(financial.get("total_commission", 0)))
+    col3.metric("Gross Profit", format_float(financial.get("gross_profit", 0)))
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Passenger Wallet Balance", format_float(financial.get("passenger_wallet_balance", 0)))
+    col2.metric("Driver Wallet Balance", format_float(financial.get("driver_wallet_balance", 0)))
+    col3.metric("Commission Owed", format_float(financial.get("commission_owed", 0)))
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Avg Commission per Trip", format_float(financial.get("avg_commission_per_trip", 0)))
+    col2.metric("Avg Revenue per Driver", format_float(financial.get("avg_revenue_per_driver", 0)))
+    col3.metric("Avg Driver Earnings per Trip", format_float(financial.get("avg_driver_earnings_per_trip", 0)))
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Fare per KM", format_float(financial.get("fare_per_km", 0)))
+    col2.metric("Revenue Share (%)", format_percent(financial.get("revenue_share", 0)))
 
-    with tabs[0]:
-        st.header("Trips Overview")
-        overview = calculate_overview_kpis(beer, passengers, drivers, start_date, end_date, selected_statuses)
-        col1, col2, col3, col4 = st.columns(4)
-        col1.metric("Total Requests", format_int(overview["total_requests"]))
-        col2.metric("Completed Trips", format_int(overview["completed_trips"]))
-        col3.metric("Avg Trip Distance (KM/Mi)", format_float(overview["avg_distance"]))
-        col4.metric("Driver Cancellation Rate", format_percent(overview["driver_cancellation_rate"] or 0))
+    # Visualizations
+    charts = ctx.chart_data()
+    if charts:
+        st.subheader("Revenue Share by Payment Mode")
+        show_chart(revenue_by_pay_mode_figure(charts))
+
+def render_user_analysis_tab(ctx):
+    st.header("User Analysis")
+    user = ctx.user_kpis()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Unique Drivers", format_int(user["unique_drivers"]))
+    col2.metric("Passenger App Downloads", format_int(user["passenger_app_downloads"]))
+    col3.metric("Riders Onboarded", format_int(user["riders_onboarded"]))
+    col1, col2 = st.columns(2)
+    col1.metric("Driver Retention Rate", format_percent(user["driver_retention_rate"]))
+    col2.metric("Passenger to Driver Ratio", format_float(user["passenger_to_driver_ratio"]))
+    if "onboarding_cohorts" in user:
+        st.subheader("Onboarding")
         col1, col2, col3, col4 = st.columns(4)
-        col1.metric("Passenger Search Timeout Rate", format_percent(overview["passenger_search_timeout_rate"] or 0))
-        col2.metric("Avg Trips per Driver", format_float(overview["avg_trips_per_driver"] or 0))
-        col3.metric("Passenger App Downloads", format_int(overview["passenger_app_downloads"]))
-        col4.metric("Riders Onboarded", format_int(overview["riders_onboarded"]))
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Total Distance Covered", format_float(overview["total_distance_covered"]))
-        col2.metric("Avg Revenue per Trip", format_float(overview["avg_revenue_per_trip"]))
-        col3.metric("Total Commission", format_float(overview["total_commission"]))
-
-        # Visualizations
-        df = overview["filtered_df"]
-        if df is not None and not df.empty:
-            st.subheader("Trip Status Distribution")
-            fig = px.pie(df, names="Trip Status", title="Trip Status Distribution")
-            st.plotly_chart(fig, use_container_width=True)
-
-            st.subheader("Trips Over Time")
-            trips_over_time = df.groupby(df["Trip Date"].dt.date).size()
-            fig2 = px.line(trips_over_time, title="Trips Over Time", labels={"index": "Date", 0: "Number of Trips"})
-            st.plotly_chart(fig2, use_container_width=True)
-
-    with tabs[1]:
-        st.header("Financial Metrics")
-        financial = calculate_financial_kpis(beer, passengers, drivers, start_date, end_date, selected_statuses)
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Total Value of Rides", format_float(financial.get("total_value_of_rides", 0)))
-        col2.metric("Total Commission", format_float(financial.get("total_commission", 0)))
-        col3.metric("Gross Profit", format_float(financial.get("gross_profit", 0)))
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Passenger Wallet Balance", format_float(financial.get("passenger_wallet_balance", 0)))
-        col2.metric("Driver Wallet Balance", format_float(financial.get("driver_wallet_balance", 0)))
-        col3.metric("Commission Owed", format_float(financial.get("commission_owed", 0)))
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Avg Commission per Trip", format_float(financial.get("avg_commission_per_trip", 0)))
-        col2.metric("Avg Revenue per Driver", format_float(financial.get("avg_revenue_per_driver", 0)))
-        col3.metric("Avg Driver Earnings per Trip", format_float(financial.get("avg_driver_earnings_per_trip", 0)))
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Fare per KM", format_float(financial.get("fare_per_km", 0)))
-        col2.metric("Revenue Share (%)", format_percent(financial.get("revenue_share", 0)))
-
-        # Visualizations
-        df = financial.get("filtered_df")
-        if df is not None and not df.empty:
-            st.subheader("Revenue Share by Payment Mode")
-            rev_by_paymode = df.groupby("Pay Mode")["Company Commission Cleaned"].sum().reset_index()
-            fig = px.pie(rev_by_paymode, names="Pay Mode", values="Company Commission Cleaned", title="Revenue Share by Payment Mode")
-            st.plotly_chart(fig, use_container_width=True)
-
-    with tabs[2]:
-        st.header("User Analysis")
-        user = calculate_user_analysis_kpis(beer, passengers, drivers, union_staff_names, start_date, end_date, selected_statuses)
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Unique Drivers", format_int(user["unique_drivers"]))
-        col2.metric("Passenger App Downloads", format_int(user["passenger_app_downloads"]))
-        col3.metric("Riders Onboarded", format_int(user["riders_onboarded"]))
-        col1, col2 = st.columns(2)
-        col1.metric("Driver Retention Rate", format_percent(user["driver_retention_rate"]))
-        col2.metric("Passenger to Driver Ratio", format_float(user["passenger_to_driver_ratio"]))
-
-        st.subheader("Union Staff Trips")
-        if not user["staff_trips_table"].empty:
-            st.dataframe(user["staff_trips_table"])
-        else:
-            st.info("No completed trips found for Union staff in the selected date range.")
-
-        # Visualizations
-        df = user["filtered_df"]
-        if df is not None and not df.empty:
-            st.subheader("Trips per Driver Distribution")
-            trips_per_driver = df.groupby("Driver").size()
-            fig = px.histogram(trips_per_driver, nbins=30, title="Trips per Driver Distribution")
-            st.plotly_chart(fig, use_container_width=True)
-    with tabs[3]:
-       st.header("Geographic Metrics")
-       geo = calculate_geographic_kpis(beer, start_date, end_date, selected_statuses)
-       col1, col2 = st.columns(2)
+        col1.metric("Drivers Activated", format_percent(user["driver_activation_rate"]),
+                    help="Drivers who signed up in the range and have completed a trip since")
+        col2.metric("Driver Days to First Trip", format_float(user["driver_days_to_first_trip"]), help="Median")
+        col3.metric("Passengers Activated", format_percent(user["passenger_activation_rate"]),
+                    help="Passengers who signed up in the range and have completed a trip since")
+        col4.metric("Passenger Days to First Trip", format_float(user["passenger_days_to_first_trip"]), help="Median")
+        if not user["onboarding_cohorts"].empty:
+            st.dataframe(user["onboarding_cohorts"])
+
+    st.subheader("Union Staff Trips")
+    if not user["staff_trips_table"].empty:
+        st.dataframe(user["staff_summary"])
+        st.dataframe(user["staff_trips_table"])
+    else:
+        st.info("No completed trips found for Union staff in the selected date range.")
+
+    # Visualizations
+    charts = ctx.chart_data()
+    if charts:
+        st.subheader("Trips per Driver Distribution")
+        show_chart(trips_per_driver_figure(charts))
+
+def render_geographic_tab(ctx):
+    st.header("Geographic Metrics")
+    geo = ctx.geographic_kpis()
+    col1, col2 = st.columns(2)
     with col1:
         st.subheader("Top 5 Pickup Locations")
         if geo.get("top_pickup") is not None:
@@ -505,55 +2441,159 @@ def main():
         else:
             st.info("No data available for dropoff locations.")
 
-        st.subheader("Peak Trip Hours")
-        if geo.get("peak_hours") is not None:
-            fig = px.bar(x=geo["peak_hours"].index, y=geo["peak_hours"].values, labels={"x": "Hour of Day", "y": "Number of Trips"}, title="Peak Trip Hours")
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("No data available for peak hours.")
+    st.subheader("Peak Trip Hours")
+    if geo.get("peak_hours") is not None:
+        show_chart(peak_hours_figure(geo))
+    else:
+        st.info("No data available for peak hours.")
 
-        st.subheader("Trip Status Trends Over Time")
-        if geo.get("trip_status_trends") is not None and not geo["trip_status_trends"].empty:
-            fig = px.line(geo["trip_status_trends"], title="Trip Status Trends Over Time")
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("No data available for trip status trends.")
+    st.subheader("Trip Status Trends Over Time")
+    if geo.get("trip_status_trends") is not None and not geo["trip_status_trends"].empty:
+        show_chart(status_trends_figure(geo))
+    else:
+        st.info("No data available for trip status trends.")
 
-        st.subheader("Customer Payment Methods")
-        if geo.get("customer_payment_methods") is not None:
-            fig = px.pie(values=geo["customer_payment_methods"].values, names=geo["customer_payment_methods"].index, title="Customer Payment Methods")
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("No data available for payment methods.")
-
-    with tabs[4]:
-        st.header("Export Data")
-        df = filter_data_by_date_and_status(beer, start_date, end_date, selected_statuses)
-        daily_metrics = generate_excel_export(df)
-        if daily_metrics is not None and not daily_metrics.empty:
-            excel_data = to_excel_bytes(daily_metrics)
-            st.download_button(label="Download Daily Metrics Excel", data=excel_data, file_name="daily_metrics.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-        else:
-            st.info("No data available to export.")
-
-        # PDF export of summary report
-        overview = calculate_overview_kpis(beer, passengers, drivers, start_date, end_date, selected_statuses)
-        financial = calculate_financial_kpis(beer, passengers, drivers, start_date, end_date, selected_statuses)
-        user = calculate_user_analysis_kpis(beer, passengers, drivers, union_staff_names, start_date, end_date, selected_statuses)
-        geographic = calculate_geographic_kpis(beer, start_date, end_date, selected_statuses)
-        pdf_bytes = generate_pdf_report(overview, financial, user, geographic)
-        st.download_button(label="Download Summary Report PDF", data=pdf_bytes, file_name="union_metrics_report.pdf", mime="application/pdf")
-
-    with tabs[5]:
-        st.header("Feedback")
-        with st.form("feedback_form"):
-            name = st.text_input("Name")
-            email = st.text_input("Email")
-            feedback = st.text_area("Feedback or Suggestions")
-            submitted = st.form_submit_button("Submit")
-            if submitted:
-                # Here you would handle feedback submission, e.g., save to file or send email
-                st.success("Thank you for your feedback!")
+    st.subheader("Customer Payment Methods")
+    if geo.get("customer_payment_methods") is not None:
+        show_chart(payment_methods_figure(geo))
+    else:
+        st.info("No data available for payment methods.")
+
+    if geo.get("od_matrix") is not None and not geo["od_matrix"].empty:
+        st.subheader("Origin-Destination Heatmap")
+        show_chart(od_heatmap_figure(geo))
+
+def on_demand_download(ctx, kind, build, label, file_name, mime):
+    # Reports are only built when asked for, then kept for this filter selection for the session
+    exports = st.session_state.setdefault("exports", {})
+    key = (kind, ctx.key)
+    slot = st.empty()
+    if key not in exports and slot.button(f"Prepare {label}", key=f"prepare_{kind}"):
+        with st.spinner(f"Preparing {label}..."):
+            exports[key] = build()
+        while len(exports) > EXPORT_MEMO_ENTRIES:
+            exports.pop(next(iter(exports)))
+    if key in exports:
+        slot.download_button(label=f"Download {label}", data=exports[key], file_name=file_name, mime=mime)
+
+def render_export_tab(ctx):
+    st.header("Export Data")
+    trips = ctx.filtered_df
+    if trips is not None and not trips.empty:
+        on_demand_download(ctx, "excel", lambda: to_excel_bytes(ctx.daily_metrics()), "Daily Metrics Excel",
+                           "daily_metrics.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    else:
+        st.info("No data available to export.")
+
+    # Filtered trips, written in chunks when the download is clicked
+    if trips is not None and not trips.empty:
+        formats = ["CSV", "Parquet"] if HAS_PYARROW else ["CSV"]
+        trips_format = st.radio("Trips export format", formats, horizontal=True)
+        st.download_button(label=f"Download Filtered Trips ({len(trips):,} rows)",
+                           data=lambda: trips_export_file(trips, trips_format.lower()),
+                           file_name=f"trips.{trips_format.lower()}",
+                           mime="text/csv" if trips_format == "CSV" else "application/octet-stream")
+
+    # PDF export of summary report
+    on_demand_download(ctx, "pdf", ctx.pdf_report, "Summary Report PDF", "union_metrics_report.pdf", "application/pdf")
+
+def render_feedback_tab(ctx):
+    st.header("Feedback")
+    with st.form("feedback_form"):
+        name = st.text_input("Name")
+        email = st.text_input("Email")
+        feedback = st.text_area("Feedback or Suggestions")
+        submitted = st.form_submit_button("Submit")
+        if submitted:
+            # Here you would handle feedback submission, e.g., save to file or send email
+            st.success("Thank you for your feedback!")
+
+TABS = {
+    "Overview": render_overview_tab,
+    "Financial": render_financial_tab,
+    "User Analysis": render_user_analysis_tab,
+    "Geographic": render_geographic_tab,
+    "Export": render_export_tab,
+    "Feedback": render_feedback_tab,
+}
+
+def render_dashboard():
+    # Theme selection
+    theme = st.sidebar.selectbox("Select Theme", options=["Light", "Dark"], index=0)
+    if theme == "Light":
+        st.markdown(LIGHT_THEME_CSS, unsafe_allow_html=True)
+    else:
+        st.markdown(DARK_THEME_CSS, unsafe_allow_html=True)
+
+    # Cleaned data from the current snapshot; the background refresher swaps in new ones
+    store = get_snapshot_store()
+    snapshot = store.current()
+    load_reports, staff_index = snapshot.reports, snapshot.staff_index
+    st.sidebar.caption(f"Data snapshot v{snapshot.version} loaded {snapshot.loaded_at:%Y-%m-%d %H:%M:%S}")
+    if store.last_error:
+        st.sidebar.warning(f"Data refresh failed ({store.last_error}), showing the last good snapshot.")
+
+    with st.sidebar.expander("Data Quality"):
+        st.caption("Amounts coerced to 0.0 during cleaning")
+        st.dataframe(pd.DataFrame.from_dict(load_reports.get("cleaning", {}), orient="index"))
+        st.caption("Transactions matched to trips")
+        st.dataframe(pd.DataFrame.from_dict(load_reports.get("join", {}), orient="index"))
+        incremental = load_reports.get("incremental", {}).get("trips")
+        if incremental:
+            st.caption(f"Last incremental refresh {incremental['refreshed_at']}: {incremental['new_rows']:,} new trips, "
+                       f"{incremental.get('new_payments', 0):,} new payments ({incremental.get('patched_trips', 0):,} "
+                       f"stored trips updated) in {incremental['seconds']:.2f}s")
+        st.caption("Memory per row of the trips table (bytes)")
+        st.dataframe(pd.DataFrame.from_dict(load_reports.get("memory", {}), orient="index"))
+        if staff_index is not None and not staff_index.empty:
+            staff_matches = staff_match_report(staff_index)
+            found = staff_matches["Match"] != "not in BEER"
+            st.caption(f"Union staff found among passengers: {found.sum()} of {len(staff_matches)} "
+                       f"({(staff_matches['Match'] == 'normalized').sum()} only after normalizing names, "
+                       f"{int(staff_matches['Entries'].sum()) - len(staff_matches)} duplicate entries)")
+            st.dataframe(staff_matches)
+
+    # Sidebar filters
+    st.sidebar.header("Filters")
+    min_date, max_date, trip_statuses = filter_options(snapshot)
+    date_range = st.sidebar.date_input("Select Date Range", value=(min_date, max_date), min_value=min_date, max_value=max_date)
+    if len(date_range) != 2:
+        st.sidebar.error("Please select a start and end date.")
+        return
+    start_date, end_date = date_range
+    selected_statuses = st.sidebar.multiselect("Select Trip Status", options=trip_statuses, default=trip_statuses)
+    ctx = snapshot_context(snapshot, start_date, end_date, selected_statuses, store.kpi_cache)
+
+    # Only the open tab is rendered, so a rerun computes just the KPIs and figures it shows
+    tabs = st.tabs(list(TABS), key="active_tab", on_change="rerun")
+    for (name, render), tab in zip(TABS.items(), tabs):
+        if tab.open:
+            with tab, perf_stage(f"tab: {name}"):
+                render(ctx)
+
+    st.sidebar.caption(f"Trip table scans this rerun: {ctx.trip_scans}")
+    if KPI_ADMIN_ENABLED:
+        with st.sidebar.expander("Admin: KPI Cache"):
+            st.dataframe(pd.DataFrame([store.kpi_cache.stats()]).T.rename(columns={0: "value"}))
+            if st.button("Clear KPI cache"):
+                store.kpi_cache.clear()
+
+def main():
+    st.set_page_config(page_title="Union App Metrics Dashboard", layout="wide", page_icon="🚖")
+    perf_start_run("rerun")
+    # Finished on every way out of the rerun (an incomplete date range returns early, a widget change
+    # interrupts it), so stages never carry over into the next rerun and memory tracing stops
+    try:
+        render_dashboard()
+    finally:
+        records = perf_finish_run()
+    if PERF_ENABLED:
+        with st.sidebar.expander("Performance"):
+            if records:
+                st.dataframe(pd.DataFrame(records)[["stage", "depth", "seconds", "rows", "peak_mb"]], hide_index=True)
+                st.caption(f"{sum(r['seconds'] for r in records if r['depth'] == 0):.3f}s in top-level stages this rerun")
+                st.download_button("Download stages (JSON lines)", data=perf_jsonl(records), file_name="perf.jsonl",
+                                   mime="application/x-ndjson")
 
 if __name__ == "__main__":
     main()
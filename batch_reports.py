@@ -0,0 +1,135 @@
+# Headless report renderer: pre-generates the Summary Report PDF and Daily Metrics Excel for every day, week
+# or month of a date range, outside Streamlit, on a pool of worker processes sharing one data snapshot
+#   python batch_reports.py --period daily weekly monthly --out reports/
+#   python batch_reports.py --period monthly --start 2025-01-01 --end 2025-06-30 --format pdf --workers 4
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from datetime import datetime as dt
+from pathlib import Path
+
+import pandas as pd
+
+import app
+
+logger = logging.getLogger("batch_reports")
+
+PERIODS = {"daily": "D", "weekly": "W-SUN", "monthly": "M"}
+FORMATS = ["pdf", "xlsx"]
+# Set in the parent before the pool forks, so workers share its pages instead of loading their own copy
+_SNAPSHOT = None
+
+def period_label(period, start):
+    if period == "weekly":
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}"
+    return f"{start:%Y-%m}" if period == "monthly" else f"{start:%Y-%m-%d}"
+
+def report_ranges(period, start_date, end_date):
+    # Whole calendar days, Monday to Sunday weeks or calendar months touching [start_date, end_date]
+    return [(period_label(period, p.start_time.date()), p.start_time.date(), p.end_time.date())
+            for p in pd.period_range(start_date, end_date, freq=PERIODS[period])]
+
+def write_output(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+    return str(path)
+
+def render_report(job):
+    # One report pack; the KPI groups are computed once and shared by the PDF and the Excel
+    period, label, start_date, end_date, statuses, formats, out_dir = job
+    snapshot = _SNAPSHOT
+    started = time.perf_counter()
+    result = {"period": period, "label": label, "start": str(start_date), "end": str(end_date), "files": []}
+    try:
+        ctx = app.snapshot_context(snapshot, start_date, end_date, statuses)
+        result["trips"] = len(ctx.filtered_df)
+        if "xlsx" in formats:
+            daily_metrics = ctx.daily_metrics()
+            if daily_metrics is not None:
+                result["files"].append(write_output(out_dir / period / f"daily_metrics_{label}.xlsx", app.to_excel_bytes(daily_metrics)))
+        if "pdf" in formats:
+            pdf = app.generate_pdf_report(ctx.overview_kpis(), ctx.financial_kpis(), ctx.user_kpis(), ctx.geographic_kpis(),
+                                          period=(start_date, end_date))
+            result["files"].append(write_output(out_dir / period / f"union_metrics_report_{label}.pdf", pdf))
+    except Exception as e:
+        logger.exception("Report %s %s failed", period, label)
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+def init_worker():
+    # The pool already spreads reports over the CPUs; no nested month-partition pools inside a worker
+    app.KPI_WORKERS = 1
+
+def render_all(jobs, workers):
+    if workers <= 1 or len(jobs) <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        yield from map(render_report, jobs)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=multiprocessing.get_context("fork"),
+                             initializer=init_worker) as pool:
+        yield from pool.map(render_report, jobs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Render Union report packs for many date ranges without Streamlit")
+    parser.add_argument("--period", nargs="+", choices=list(PERIODS), default=["daily", "weekly", "monthly"])
+    parser.add_argument("--start", type=date.fromisoformat, help="first day to cover (default: first trip)")
+    parser.add_argument("--end", type=date.fromisoformat, help="last day to cover (default: last trip)")
+    parser.add_argument("--last", type=int, help="only the last N reports of each period")
+    parser.add_argument("--status", action="append", default=[], help="Trip Status to include, repeatable (default: all)")
+    parser.add_argument("--format", nargs="+", choices=FORMATS, default=FORMATS)
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: one per CPU)")
+    parser.add_argument("--data-dir", type=Path, default=Path("."), help="directory holding the workbooks and .cache")
+    parser.add_argument("--out", type=Path, default=Path("reports"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    global _SNAPSHOT
+    out_dir = args.out.resolve()
+    # FILES and the cache directory are relative to the data directory, as for the dashboard
+    os.chdir(args.data_dir)
+    started = time.perf_counter()
+    _SNAPSHOT = app.build_snapshot(1, {name: app.file_fingerprint(path) for name, path in app.FILES.items()})
+    beer, trip_store = _SNAPSHOT.beer, _SNAPSHOT.trip_store
+    # UNION_BACKEND=sqlite/duckdb: the trips stay in the trip store and each worker queries its reports
+    trips = trip_store.rows if trip_store is not None else len(beer) if beer is not None else 0
+    if not trips:
+        sys.exit("No trips loaded, nothing to report")
+    logger.info("Loaded %s trips in %.1fs", f"{trips:,}", time.perf_counter() - started)
+    first_trip, last_trip, _ = app.filter_options(_SNAPSHOT)
+    start_date = args.start or first_trip.date()
+    end_date = args.end or last_trip.date()
+    jobs = []
+    for period in args.period:
+        ranges = report_ranges(period, start_date, end_date)
+        for label, range_start, range_end in ranges[-args.last:] if args.last else ranges:
+            jobs.append((period, label, range_start, range_end, args.status, args.format, out_dir))
+
+    workers = args.workers or os.cpu_count()
+    results = []
+    for result in render_all(jobs, workers):
+        results.append(result)
+        logger.info("%s %s: %s trips, %d files, %.2fs%s", result["period"], result["label"], f"{result.get('trips', 0):,}",
+                    len(result["files"]), result["seconds"], f" FAILED: {result['error']}" if "error" in result else "")
+    failed = [r for r in results if "error" in r]
+    write_output(out_dir / "reports.json", json.dumps({
+        "generated_at": dt.now().isoformat(timespec="seconds"),
+        "start": str(start_date),
+        "end": str(end_date),
+        "statuses": args.status or "all",
+        "seconds": round(time.perf_counter() - started, 3),
+        "reports": results,
+    }, indent=2).encode("utf-8"))
+    logger.info("%d reports (%d failed) written to %s in %.1fs", len(results), len(failed), out_dir, time.perf_counter() - started)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Benchmark: browser payload of every dashboard figure, per-trip figures vs the chart data layer
+#   python benchmarks/bench_charts.py --rows 1000000 --days 1825
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+import plotly.express as px
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import app  # noqa: E402
+from synthetic import make_trips  # noqa: E402
+
+
+def raw_figures(df, geo):
+    # The figures as the tabs used to build them, straight from the filtered trips
+    trips_over_time = df.groupby(df["Trip Date"].dt.date).size()
+    rev_by_paymode = df.groupby("Pay Mode", observed=True)["Company Commission Cleaned"].sum().reset_index()
+    trips_per_driver = df.groupby("Driver", observed=True).size()
+    return {
+        "trip_status": px.pie(df, names="Trip Status", title="Trip Status Distribution"),
+        "trips_over_time": px.line(trips_over_time, title="Trips Over Time", labels={"index": "Date", 0: "Number of Trips"}),
+        "revenue_by_pay_mode": px.pie(rev_by_paymode, names="Pay Mode", values="Company Commission Cleaned", title="Revenue Share by Payment Mode"),
+        "trips_per_driver": px.histogram(trips_per_driver, nbins=30, title="Trips per Driver Distribution"),
+        "peak_hours": app.peak_hours_figure(geo),
+        "status_trends": px.line(geo["trip_status_trends"], title="Trip Status Trends Over Time"),
+        "payment_methods": app.payment_methods_figure(geo),
+        # Every pickup against every dropoff location, before they were grouped into zones
+        "od_heatmap": px.imshow(pd.crosstab(df["Pickup Location"], df["Dropoff Location"]), title="Trips Between Zones"),
+    }
+
+
+def layer_figures(charts, geo):
+    return {
+        "trip_status": app.trip_status_figure(charts),
+        "trips_over_time": app.trips_over_time_figure(charts),
+        "revenue_by_pay_mode": app.revenue_by_pay_mode_figure(charts),
+        "trips_per_driver": app.trips_per_driver_figure(charts),
+        "peak_hours": app.peak_hours_figure(geo),
+        "status_trends": app.status_trends_figure(geo),
+        "payment_methods": app.payment_methods_figure(geo),
+        "od_heatmap": app.od_heatmap_figure(geo),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Browser payload of every dashboard figure, per-trip figures vs the chart data layer")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=1825)
+    parser.add_argument("--skip-raw", action="store_true", help="only build the chart data layer figures")
+    args = parser.parse_args()
+
+    trips = make_trips(args.rows, days=args.days)
+    rollup = app.build_daily_rollup(trips)
+    locations = app.build_location_activity(trips)
+    geo = app.calculate_geographic_kpis(trips, None, None, None, filtered_df=trips, rollup_rows=rollup, location_rows=locations)
+
+    start = time.perf_counter()
+    new = layer_figures(app.chart_data(trips, rollup_rows=rollup), geo)
+    new_time = time.perf_counter() - start
+    old = {}
+    if not args.skip_raw:
+        start = time.perf_counter()
+        old = raw_figures(trips, geo)
+        print(f"built raw figures in {time.perf_counter() - start:.2f}s, chart data layer figures in {new_time:.2f}s")
+
+    over_cap = []
+    print(f"{'figure':<22}{'raw points':>12}{'raw bytes':>14}{'points':>10}{'bytes':>12}")
+    for name, fig in new.items():
+        raw = old.get(name)
+        raw_cols = f"{app.figure_points(raw):>12,}{len(raw.to_json()):>14,}" if raw is not None else f"{'-':>12}{'-':>14}"
+        print(f"{name:<22}{raw_cols}{app.figure_points(fig):>10,}{len(fig.to_json()):>12,}")
+        if app.figure_points(fig) > app.MAX_CHART_POINTS:
+            over_cap.append(name)
+    if over_cap:
+        print(f"over MAX_CHART_POINTS={app.MAX_CHART_POINTS}: {', '.join(over_cap)}")
+    sys.exit(1 if over_cap else 0)
+
+
+if __name__ == "__main__":
+    main()
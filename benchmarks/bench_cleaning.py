@@ -0,0 +1,72 @@
+# Benchmark: vectorized clean_ugx_amount against the previous per-cell Series.apply version
+#   python benchmarks/bench_cleaning.py --rows 1000000
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app import clean_ugx_amount  # noqa: E402
+from synthetic import make_beer, make_transactions  # noqa: E402
+
+COLUMNS = [("beer", "Trip Pay Amount"), ("transactions", "Company Amt (UGX)")]
+
+
+def legacy_clean_ugx_amount(series):
+    def clean_value(x):
+        if pd.isna(x):
+            return 0.0
+        if isinstance(x, (int, float)):
+            return float(x)
+        try:
+            s = str(x).replace("UGX", "").replace(",", "").strip()
+            if s == "":
+                return 0.0
+            return float(s)
+        except Exception:
+            return 0.0
+    return series.apply(clean_value)
+
+
+def best_of(func, series, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(series)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized clean_ugx_amount against the per-cell Series.apply version")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-speedup", type=float, default=10.0)
+    args = parser.parse_args()
+
+    beer = make_beer(args.rows)
+    tables = {"beer": beer, "transactions": make_transactions(beer)}
+    failed = False
+    for table, col in COLUMNS:
+        series = tables[table][col]
+        legacy_time, expected = best_of(legacy_clean_ugx_amount, series, args.repeat)
+        report = {}
+        vector_time, result = best_of(lambda s: clean_ugx_amount(s, report, col), series, args.repeat)
+        pd.testing.assert_series_equal(result, expected, check_names=False)
+        speedup = legacy_time / vector_time
+        failed |= speedup < args.min_speedup
+        print(f"{col:<28} rows={len(series):>9,}  apply={legacy_time:7.3f}s  vectorized={vector_time:7.3f}s  "
+              f"speedup={speedup:5.1f}x  coerced_to_zero={report[col]['coerced_to_zero']:,}")
+    # Numeric fast path: a column that was already parsed by read_excel
+    numeric = clean_ugx_amount(beer["Trip Pay Amount"])
+    legacy_time, _ = best_of(legacy_clean_ugx_amount, numeric, args.repeat)
+    vector_time, _ = best_of(clean_ugx_amount, numeric, args.repeat)
+    print(f"{'(numeric dtype)':<28} rows={args.rows:>9,}  apply={legacy_time:7.3f}s  vectorized={vector_time:7.3f}s  "
+          f"speedup={legacy_time / vector_time:5.1f}x")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# Benchmark: joining TRANSACTIONS onto the trips table (join_transactions)
+#   python benchmarks/bench_join.py --rows 1000000
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app import clean_ugx_amount, join_transactions, sort_trips  # noqa: E402
+from synthetic import make_beer, make_transactions  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time joining TRANSACTIONS onto the trips table, by trip id and by driver, passenger and time")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--max-seconds", type=float, default=1.0, help="budget for the trip id join")
+    args = parser.parse_args()
+
+    beer = make_beer(args.rows)
+    transactions = make_transactions(beer)
+    transactions["Company Amt (UGX)"] = clean_ugx_amount(transactions["Company Amt (UGX)"])
+    beer["Company Commission Cleaned"] = 0.0
+    beer["Pay Mode"] = "Unknown"
+    beer = sort_trips(beer)
+
+    failed = False
+    for method, payments in [("trip_id", transactions), ("driver_passenger_time", transactions.drop(columns="Trip ID"))]:
+        report = {}
+        start = time.perf_counter()
+        join_transactions(beer.copy(), payments, report)
+        elapsed = time.perf_counter() - start
+        stats = report["join"]["transactions"]
+        assert stats["method"] == method
+        if method == "trip_id":
+            failed |= elapsed > args.max_seconds
+        print(f"{method:<22} trips={stats['trips']:>9,}  payments={stats['payments']:>8,}  time={elapsed:6.3f}s  "
+              f"match_rate={stats['trip_match_rate']:.3f}  completed_match_rate={stats['completed_match_rate']:.3f}  "
+              f"unmatched_payments={stats['unmatched_payments']:,}  duplicate_matches_dropped={stats['duplicate_matches_dropped']:,}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Benchmark: month-partitioned KPI aggregation (trip_aggregates) across worker processes
+#   python benchmarks/bench_parallel.py --rows 10000000 --workers 1 2 4 8
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app import daily_aggregates, month_partitions, trip_aggregates  # noqa: E402
+from synthetic import make_trips  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Month-partitioned KPI aggregation across worker processes")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    trips = make_trips(args.rows)
+    print(f"{len(trips):,} trips in {len(month_partitions(trips))} months, generated in {time.perf_counter() - start:.1f}s, "
+          f"{os.cpu_count()} CPUs")
+
+    start = time.perf_counter()
+    daily_aggregates(trips)
+    print(f"{'single groupby':<16} time={time.perf_counter() - start:7.3f}s  (daily export columns only)")
+
+    reference = None
+    baseline = None
+    for workers in args.workers:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = trip_aggregates(trips, workers=workers)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        baseline = baseline or best
+        # Every worker count has to produce the same merged aggregates
+        if reference is None:
+            reference = result
+        else:
+            assert result["daily"].equals(reference["daily"])
+            assert np.array_equal(result["counts"]["Driver"], reference["counts"]["Driver"])
+            assert np.allclose(result["driver_pay"], reference["driver_pay"])
+        print(f"{workers:>2} workers       time={best:7.3f}s  speedup={baseline / best:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# Headless benchmark of the dashboard pipeline on synthetic data: wall time and peak memory per stage
+#   python benchmarks/run.py --rows 10000 100000 1000000 --save baseline.json
+#   python benchmarks/run.py --rows 10000 100000 1000000 --baseline baseline.json   (exits 1 on a regression)
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime as dt
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import app  # noqa: E402
+from synthetic import make_dataset  # noqa: E402
+
+# A typical narrow selection: the last month, completed and cancelled trips only
+MONTH_STATUSES = ["Job Completed", "Cancelled by Rider", "Cancelled by Driver At Pickup Location"]
+
+
+def measure(func, setup=tuple, repeat=3, memory=True):
+    # Best wall time over repeat untraced runs, then one run under tracemalloc for the peak (tracing
+    # slows pandas down too much to time the same run). setup() builds the arguments outside both.
+    timings = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    peak_mb = None
+    if memory:
+        args = setup()
+        tracemalloc.start()
+        func(*args)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    return min(timings), peak_mb, result
+
+
+def run_size(n_rows, seed, repeat, memory, backends=()):
+    results = []
+
+    def stage(name, func, setup=tuple, rows=None):
+        seconds, peak_mb, result = measure(func, setup, repeat, memory)
+        results.append({"rows": n_rows, "stage": name, "input_rows": rows, "seconds": round(seconds, 6),
+                        "peak_mb": None if peak_mb is None else round(peak_mb, 3)})
+        return result
+
+    def preprocess(raw):
+        return app.preprocess_data(raw["passengers"], raw["drivers"], raw["beer"], raw["transactions"], raw["union_staff"])
+
+    # preprocess_data cleans its frames in place, so every run gets a freshly generated (identical) dataset
+    # rather than a copy of one kept around, which would not fit in memory at 10M rows
+    passengers, drivers, beer, staff_names = stage("preprocess_data", preprocess, lambda: (make_dataset(n_rows, seed=seed),), n_rows)
+    rollup = stage("build_daily_rollup", lambda: app.build_daily_rollup(beer), rows=len(beer))
+    union_staff = pd.DataFrame({"Union Staff": staff_names})
+    staff_index = stage("build_staff_index", lambda: app.build_staff_index(beer, union_staff), rows=len(beer))
+    staff_trips = stage("build_staff_trips", lambda: app.build_staff_trips(beer, staff_index), rows=len(beer))
+    activity = stage("build_entity_activity", lambda: app.build_entity_activity(beer), rows=len(beer))
+    cohorts = stage("build_user_cohorts", lambda: app.build_user_cohorts(activity, drivers, passengers), rows=len(activity))
+    locations = stage("build_location_activity", lambda: app.build_location_activity(beer), rows=len(beer))
+    start_date, end_date = beer["Trip Date"].min().date(), beer["Trip Date"].max().date()
+    statuses = beer["Trip Status"].unique().tolist()
+    df = stage("filter (all trips)", lambda: app.filter_data_by_date_and_status(beer, start_date, end_date, statuses), rows=len(beer))
+    month_start = (pd.Timestamp(end_date) - pd.Timedelta(days=30)).date()
+    stage("filter (last month)", lambda: app.filter_data_by_date_and_status(beer, month_start, end_date, MONTH_STATUSES), rows=len(beer))
+    rollup_rows = app.filter_data_by_date_and_status(rollup, start_date, end_date, statuses, date_column="Day")
+    activity_rows = app.filter_data_by_date_and_status(activity, start_date, end_date, statuses, date_column="Day")
+    totals = stage("entity_totals", lambda: app.entity_totals(activity_rows), rows=len(activity_rows))
+    location_rows = app.filter_data_by_date_and_status(locations, start_date, end_date, statuses, date_column="Day")
+    stage("od_matrix", lambda: app.od_matrix(location_rows), rows=len(location_rows))
+    overview = stage("calculate_overview_kpis", lambda: app.calculate_overview_kpis(
+        beer, passengers, drivers, start_date, end_date, statuses, filtered_df=df, rollup_rows=rollup_rows, entity_totals=totals), rows=len(df))
+    financial = stage("calculate_financial_kpis", lambda: app.calculate_financial_kpis(
+        beer, passengers, drivers, start_date, end_date, statuses, filtered_df=df, rollup_rows=rollup_rows, entity_totals=totals), rows=len(df))
+    user = stage("calculate_user_analysis_kpis", lambda: app.calculate_user_analysis_kpis(
+        beer, passengers, drivers, staff_names, start_date, end_date, statuses, filtered_df=df, staff_trips=staff_trips,
+        entity_totals=totals, cohorts=cohorts), rows=len(df))
+    geographic = stage("calculate_geographic_kpis", lambda: app.calculate_geographic_kpis(
+        beer, start_date, end_date, statuses, filtered_df=df, rollup_rows=rollup_rows, location_rows=location_rows), rows=len(df))
+    stage("trip_aggregates", lambda: app.trip_aggregates(df), rows=len(df))
+    stage("chart_data", lambda: app.chart_data(df, rollup_rows=rollup_rows, entity_totals=totals), rows=len(df))
+    daily_metrics = stage("generate_excel_export", lambda: app.generate_excel_export(df), rows=len(df))
+    stage("to_excel_bytes", lambda: app.to_excel_bytes(daily_metrics), rows=len(daily_metrics))
+    stage("generate_pdf_report", lambda: app.generate_pdf_report(overview, financial, user, geographic))
+
+    def dashboard():
+        # Every tab of one cold rerun, the way AnalysisContext shares the filtered frame between them
+        ctx = app.AnalysisContext(beer, passengers, drivers, staff_names, start_date, end_date, statuses, rollup,
+                                  staff_trips=staff_trips, entity_activity=activity, user_cohorts=cohorts,
+                                  location_activity=locations)
+        for group in (ctx.overview_kpis, ctx.financial_kpis, ctx.user_kpis, ctx.geographic_kpis, ctx.chart_data,
+                      ctx.daily_metrics, ctx.pdf_report):
+            group()
+    stage("dashboard (all tabs, cold)", dashboard, rows=len(beer))
+
+    for engine in backends:
+        # Same selections read from an on-disk trip store instead of the in-memory trips
+        with tempfile.TemporaryDirectory() as cache_dir:
+            app.CACHE_DIR = Path(cache_dir)
+            sources = [{"rows": n_rows, "seed": seed}]
+            store = stage(f"store write ({engine})", lambda: app.TripStore.open(beer, sources, engine),
+                          setup=lambda: [path.unlink() for path in Path(cache_dir).glob("trips-*")] and (), rows=len(beer))
+            stage(f"store select month ({engine})", lambda: store.select(month_start, end_date, MONTH_STATUSES), rows=len(beer))
+            stage(f"store daily export ({engine})", lambda: store.daily_aggregates(start_date, end_date, statuses), rows=len(beer))
+    return results
+
+
+def regressions(results, baseline, tolerance, min_seconds, min_mb):
+    # Stages slower (or hungrier) than tolerance x the baseline, ignoring differences too small to mean anything
+    previous = {(r["rows"], r["stage"]): r for r in baseline["results"]}
+    found = []
+    for r in results:
+        base = previous.get((r["rows"], r["stage"]))
+        if base is None:
+            continue
+        if r["seconds"] > base["seconds"] * tolerance and r["seconds"] - base["seconds"] > min_seconds:
+            found.append(f"{r['stage']} @ {r['rows']:,} rows: {base['seconds']:.3f}s -> {r['seconds']:.3f}s")
+        if r["peak_mb"] is not None and base.get("peak_mb") is not None and \
+                r["peak_mb"] > base["peak_mb"] * tolerance and r["peak_mb"] - base["peak_mb"] > min_mb:
+            found.append(f"{r['stage']} @ {r['rows']:,} rows: {base['peak_mb']:.1f}MB -> {r['peak_mb']:.1f}MB peak")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time and memory per pipeline stage on synthetic data")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="BEER sizes, up to 10M")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass (much faster at 10M rows)")
+    parser.add_argument("--backend", nargs="+", choices=["sqlite", "duckdb"], default=[], help="also time these trip stores")
+    parser.add_argument("--save", type=Path, help="write the results as JSON, e.g. to use as a baseline")
+    parser.add_argument("--baseline", type=Path, help="results JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown / memory growth factor")
+    parser.add_argument("--min-seconds", type=float, default=0.01)
+    parser.add_argument("--min-mb", type=float, default=1.0)
+    args = parser.parse_args()
+
+    results = []
+    for n_rows in args.rows:
+        for r in run_size(n_rows, args.seed, args.repeat, not args.no_memory, args.backend):
+            results.append(r)
+            peak = "" if r["peak_mb"] is None else f"{r['peak_mb']:9.1f}MB"
+            print(f"{r['rows']:>10,}  {r['stage']:<30} {r['seconds']:9.4f}s {peak}")
+    report = {
+        "created": dt.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+        "kpi_workers": app.KPI_WORKERS,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2))
+    if args.baseline:
+        found = regressions(results, json.loads(args.baseline.read_text()), args.tolerance, args.min_seconds, args.min_mb)
+        for line in found:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# Import-time profile of app.py: imports it in fresh interpreters under `python -X importtime` and shows
+# the self time summed per top-level package plus the cumulative time of each module app imports directly
+#   python benchmarks/startup.py --repeat 5 --top 15
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def import_times():
+    # One import of app; returns {module: (self_us, cumulative_us, depth)}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, capture_output=True, text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        times[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    if "app" not in times:
+        sys.exit(f"import app failed:\n{result.stderr[-2000:]}")
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Where the time goes when app.py is imported")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters to run; the fastest of each figure is kept")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.repeat)]
+    packages = defaultdict(lambda: float("inf"))
+    direct = defaultdict(lambda: float("inf"))
+    for times in runs:
+        per_package = defaultdict(int)
+        for name, (self_us, cumulative_us, depth) in times.items():
+            per_package[name.split(".")[0]] += self_us
+            # app is imported at depth 0 from -c, its own imports sit one level below it
+            if depth == 1:
+                direct[name] = min(direct[name], cumulative_us)
+        for package, self_us in per_package.items():
+            packages[package] = min(packages[package], self_us)
+    total = min(times["app"][1] for times in runs)
+
+    print(f"import app: {total / 1e6:.3f}s (fastest of {args.repeat})\n")
+    print("self time by top-level package")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {package:<30} {self_us / 1e3:9.1f}ms {self_us / total:6.1%}")
+    print("\nmodules imported by app (cumulative, already-loaded dependencies count where first imported)")
+    for name, cumulative_us in sorted(direct.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<30} {cumulative_us / 1e3:9.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
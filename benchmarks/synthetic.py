@@ -0,0 +1,299 @@
+# Synthetic Union data shaped like the PASSENGERS, DRIVERS, BEER, TRANSACTIONS and UNION STAFF exports
+#   python benchmarks/synthetic.py --rows 100000 --out /tmp/union-data   (writes the five workbooks)
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Status mix of the real BEER export: most requests expire or are cancelled before anyone rides
+TRIP_STATUSES = ["Expired", "Job Completed", "Request Cancel", "Cancelled by Rider", "Cancelled by Driver At Pickup Location",
+                 "Cancelled", "Partner Assigned", "Payment Awaited", "Request", "Begin", "Partner Accept", "Partner Arrive"]
+STATUS_WEIGHTS = [0.361, 0.25, 0.191, 0.141, 0.028, 0.009, 0.008, 0.006, 0.003, 0.001, 0.001, 0.001]
+# Requests that never reached a driver are exported with Driver "-"
+UNASSIGNED_STATUSES = ["Expired", "Request Cancel", "Request"]
+PAY_MODES = ["Cash", "Card", "Wallet", "Unknown"]
+PAY_MODE_WEIGHTS = [0.70, 0.10, 0.10, 0.10]
+FARES = [2000, 2500, 2070, 3000, 3500, 4000, 4500, 5500, 7000]
+FARE_WEIGHTS = [0.40, 0.27, 0.06, 0.07, 0.06, 0.05, 0.04, 0.03, 0.02]
+COMMISSION_RATES = [0.0549, 0.07, 0.0725]
+ADJUSTMENTS = [0, 80, 150, 400, 430, 450]
+
+FIRST_NAMES = ["Ronald", "Betty", "James", "Janet", "Joseph", "Winny", "Isma", "Mary", "Gerald", "Grace", "Moses", "Sarah",
+               "Brian", "Ruth", "Denis", "Agnes", "Ivan", "Esther", "Paul", "Sharon", "Yasin", "Florence", "Emmanuel", "Rahama"]
+LAST_NAMES = ["Muwonge", "Chemutai", "Okello", "Atuheire", "Efitre", "Apili", "Kibumba", "Nagawa", "Nabaasa", "Obela",
+              "Onencan", "Wasswa", "Tubajunana", "Namubiru", "Ssempijja", "Akello", "Mugisha", "Nakato", "Odongo", "Auma"]
+TOWNS = ["Kampala", "Gulu", "Arua", "Mbarara", "Mubende", "Jinja", "Lira", "Masaka", "Fort Portal", "Mbale"]
+TOWN_WEIGHTS = [0.40, 0.14, 0.10, 0.08, 0.07, 0.06, 0.05, 0.04, 0.03, 0.03]
+PLACES = ["Rd", "St", "Hotel", "Secondary School", "Market", "Stage", "Plaza", "Hospital", "Church", "Taxi Park"]
+# Excel's row limit, minus the header
+XLSX_MAX_ROWS = 1_048_575
+
+
+def zipf_weights(n, exponent=1.0):
+    # A few busy drivers, passengers and stages take most of the trips
+    weights = 1 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def ugx_strings(amounts, rng, decimals=False):
+    # Raw amounts as exported: "UGX2500", "UGX1,500.00", plus a few blanks and placeholders
+    fmt = "UGX{:,.2f}" if decimals else "UGX{:,.0f}"
+    uniques, codes = np.unique(amounts, return_inverse=True)
+    noise = rng.random(len(codes))
+    codes[noise < 0.01] = len(uniques)
+    codes[(noise >= 0.01) & (noise < 0.02)] = len(uniques) + 1
+    return pick([fmt.format(a) for a in uniques] + [None, "-"], codes).array
+
+
+def pick(labels, codes):
+    # Strings by code without building one Python object per row
+    return pd.Series(pd.array(labels, dtype="str").take(codes))
+
+
+def person_names(n, offset=0):
+    # Deterministic "First Last" names, numbered once the combinations run out; offset keeps drivers
+    # and passengers apart
+    index = np.arange(offset, offset + n)
+    combos = len(FIRST_NAMES) * len(LAST_NAMES)
+    return [f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[i // len(FIRST_NAMES) % len(LAST_NAMES)]}"
+            + (f" {i // combos}" if i >= combos else "") for i in index]
+
+
+def driver_names(n):
+    return person_names(n, offset=10_000_000)
+
+
+def locations(n):
+    towns = np.random.default_rng(n).choice(TOWNS, n, p=TOWN_WEIGHTS)
+    return [f"{i % 97 + 1} {LAST_NAMES[i % len(LAST_NAMES)]} {PLACES[i // len(LAST_NAMES) % len(PLACES)]}, {town}, Uganda"
+            for i, town in enumerate(towns)]
+
+
+def population(n_rows):
+    # Registered passengers and drivers, and distinct addresses, for a BEER export of n_rows trips
+    return {
+        "passengers": max(n_rows // 5, 10),
+        "drivers": max(n_rows // 50, 10),
+        "locations": min(max(n_rows // 3, 50), 50_000),
+    }
+
+
+def trip_dates(n_rows, rng, start, days):
+    return pd.Timestamp(start) + pd.to_timedelta(np.sort(rng.integers(0, days * 86400, n_rows)), unit="s")
+
+
+def make_beer(n_rows, seed=0, start="2023-01-01", days=730, newest_first=True):
+    # The raw BEER export: 11 columns, UGX strings, Driver "-" on unassigned requests, newest trip first
+    rng = np.random.default_rng(seed)
+    sizes = population(n_rows)
+    status = rng.choice(len(TRIP_STATUSES), n_rows, p=STATUS_WEIGHTS)
+    completed = status == TRIP_STATUSES.index("Job Completed")
+    unassigned = np.isin(status, [TRIP_STATUSES.index(s) for s in UNASSIGNED_STATUSES])
+    drivers = rng.choice(sizes["drivers"], n_rows, p=zipf_weights(sizes["drivers"]))
+    drivers[unassigned] = sizes["drivers"]
+    # Fares are quoted up front, but only completed trips (and a few in-flight ones) keep them
+    pay = np.asarray(FARES, dtype=float)[rng.choice(len(FARES), n_rows, p=FARE_WEIGHTS)]
+    pay[~completed & (rng.random(n_rows) > 0.1)] = 0
+    distance = rng.gamma(1.3, 4.5, n_rows)
+    distance[rng.random(n_rows) < 0.005] *= 20
+    place_weights = zipf_weights(sizes["locations"], 0.9)
+    place_names = locations(sizes["locations"])
+    # Exports are ordered by Id, which only roughly follows Trip Date. Every other column is drawn
+    # independently per row, so flipping Id and Trip Date is enough for newest first.
+    ids = np.arange(1, n_rows + 1)
+    dates = trip_dates(n_rows, rng, start, days) + pd.to_timedelta(rng.integers(-600, 600, n_rows), unit="s")
+    if newest_first:
+        ids, dates = ids[::-1], dates[::-1]
+    return pd.DataFrame({
+        "Id": ids,
+        "Trip Type": pick(["Normal", "Single Ride"], rng.choice(2, n_rows, p=[0.94, 0.06])),
+        "Passenger": pick(person_names(sizes["passengers"]), rng.choice(sizes["passengers"], n_rows, p=zipf_weights(sizes["passengers"], 0.8))),
+        "Driver": pick(driver_names(sizes["drivers"]) + ["-"], drivers),
+        "Trip Date": dates,
+        "From Location": pick(place_names, rng.choice(sizes["locations"], n_rows, p=place_weights)),
+        "To Location": pick(place_names, rng.choice(sizes["locations"], n_rows, p=place_weights)),
+        "Trip Distance (KM/Mi)": distance.round(2),
+        "Trip Pay Amount": ugx_strings(pay, rng),
+        "Saved By": pick(["App", "Admin"], (rng.random(n_rows) < 0.001).astype(int)),
+        "Trip Status": pick(TRIP_STATUSES, status),
+    })
+
+
+def make_people(n_rows, kind, seed=0, start="2023-01-01", days=730):
+    # PASSENGERS or DRIVERS: sign-ups run from half a year before the first trip, wallets are mostly "UGX0"
+    rng = np.random.default_rng(seed)
+    names = person_names(n_rows) if kind == "passengers" else driver_names(n_rows)
+    created = pd.Timestamp(start) - pd.Timedelta(days=180) + pd.to_timedelta(
+        np.sort(rng.integers(0, (days + 180) * 86400, n_rows)), unit="s")
+    modified = created + pd.to_timedelta(rng.integers(0, 3600, n_rows) * (rng.random(n_rows) < 0.5), unit="s")
+    wallet = np.zeros(n_rows)
+    funded = rng.random(n_rows) < (0.002 if kind == "passengers" else 0.05)
+    wallet[funded] = rng.choice([500, 1000, 2000, 3356.8, 5000], int(funded.sum()))
+    if kind == "drivers":
+        # Negative balances are commission owed to Union
+        owing = rng.random(n_rows) < 0.03
+        wallet[owing] = -rng.choice([70, 140, 175, 350], int(owing.sum()))
+    phones = (700_000_000 + rng.integers(0, 90_000_000, n_rows)).astype(object)
+    if kind == "drivers":
+        email = pd.Series(names).str.replace(" ", "", regex=False).str.lower() + "@unionboda.com"
+    else:
+        email = pd.Series(names).str.replace(" ", ".", regex=False).str.lower() + "@gmail.com"
+        email[rng.random(n_rows) < 0.7] = None
+    people = pd.DataFrame({
+        "Id": np.arange(1, n_rows + 1),
+        "Name": names,
+        "Email": email,
+        "Country Iso Code": "UG",
+        "Country Code": 256 if kind == "drivers" else "256",
+        "Phone": phones,
+    })
+    if kind == "passengers":
+        # Ratings are mostly 0, with the odd amount string that leaked into the column
+        rating = np.zeros(n_rows, dtype=object)
+        rating[rng.random(n_rows) < 0.01] = "UGX0"
+        people["Rating(Avg)"] = rating
+    people["Wallet Balance"] = np.array(["UGX{:g}".format(w) for w in wallet], dtype=object)
+    people["Created"] = created
+    people["Modified"] = modified
+    return people.iloc[::-1].reset_index(drop=True)
+
+
+def make_transactions(beer, seed=0, shuffle=True):
+    # One "Trip" payment per completed trip (plus cancellation fees) keyed by "Trip ID", and wallet
+    # recharges, rewards and subscriptions with Trip ID 0
+    rng = np.random.default_rng(seed)
+    trips = beer[(beer["Trip Status"] == "Job Completed")
+                 | ((beer["Trip Status"] == "Cancelled by Rider") & (rng.random(len(beer)) < 0.05))].reset_index(drop=True)
+    fee = (trips["Trip Status"] != "Job Completed").to_numpy()
+    total = np.asarray(FARES, dtype=float)[rng.choice(len(FARES), len(trips), p=FARE_WEIGHTS)]
+    total[fee] = 500
+    commission = (total * rng.choice(COMMISSION_RATES, len(trips))).round(1)
+    adjust = rng.choice(ADJUSTMENTS, len(trips)).astype(float)
+    payments = pd.DataFrame({
+        "Trip ID": trips["Id"],
+        "Date": trips["Trip Date"] + pd.to_timedelta(rng.integers(60, 1800, len(trips)), unit="s"),
+        "Type": "Trip",
+        "Driver": trips["Driver"],
+        "Passenger": trips["Passenger"],
+        "Trip Status": trips["Trip Status"],
+        "Pay Mode": rng.choice(["Cash", "Card", "Wallet"], len(trips), p=[0.76, 0.12, 0.12]),
+        "Description": np.where(fee, "Cancellation fee", "Trip Payment"),
+        "total": total,
+        "commission": commission,
+        "adjust": adjust,
+    })
+    n_other = len(trips) // 4
+    kinds = rng.choice(["Recharge", "Reward", "Subscription", "Change Payment"], n_other, p=[0.70, 0.22, 0.06, 0.02])
+    description = pd.Series(kinds).map({"Recharge": "Recharge", "Subscription": "Subscription for Weekly Subscription",
+                                        "Change Payment": "Balance Transfer"})
+    description[kinds == "Recharge"] = rng.choice(["Recharge", "Recharge From Admin", "Wallet Recharge"], int((kinds == "Recharge").sum()))
+    description[kinds == "Reward"] = [f"Reward({i})" for i in rng.integers(1, 120, int((kinds == "Reward").sum()))]
+    source = beer.iloc[rng.integers(0, len(beer), n_other)].reset_index(drop=True) if len(beer) else beer
+    other = pd.DataFrame({
+        "Trip ID": 0,
+        "Date": source["Trip Date"] + pd.to_timedelta(rng.integers(0, 86400, n_other), unit="s"),
+        "Type": kinds,
+        "Driver": source["Driver"],
+        "Passenger": source["Passenger"],
+        "Trip Status": "",
+        "Pay Mode": "Wallet",
+        "Description": description,
+        "total": rng.choice([1000, 2000, 5000, 10000], n_other).astype(float),
+        "commission": 0.0,
+        "adjust": 0.0,
+    })
+    transactions = pd.concat([payments, other], ignore_index=True).sort_values("Date", kind="stable", ignore_index=True)
+    transactions = transactions.sample(frac=1, random_state=seed, ignore_index=True) if shuffle else transactions
+    transactions.insert(0, "Id", np.arange(1, len(transactions) + 1))
+    # Date comes out of the export as text
+    transactions["Date"] = transactions["Date"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    transactions["Total (UGX)"] = ugx_strings(transactions["total"].to_numpy(), rng, decimals=True)
+    transactions["Company Amt (UGX)"] = ugx_strings(transactions["commission"].to_numpy(), rng, decimals=True)
+    transactions["Driver Amt (UGX)"] = ugx_strings((transactions["total"] - transactions["commission"] - transactions["adjust"]).to_numpy(),
+                                                   rng, decimals=True)
+    transactions["TAX (UGX)"] = 0
+    transactions["Adjust amt (UGX)"] = transactions["adjust"]
+    transactions["Promo amt (UGX)"] = 0
+    return transactions.drop(columns=["total", "commission", "adjust"])
+
+
+def make_union_staff(beer, n_staff=40, seed=0):
+    # Staff are frequent passengers, typed by hand: odd casing and stray spaces
+    rng = np.random.default_rng(seed)
+    riders = beer["Passenger"].value_counts().index[:n_staff * 3]
+    names = pd.Series(rng.choice(np.asarray(riders, dtype=object), min(n_staff, len(riders)), replace=False))
+    noise = rng.random(len(names))
+    names[noise < 0.2] = names[noise < 0.2].str.upper()
+    names[(noise >= 0.2) & (noise < 0.35)] = names[(noise >= 0.2) & (noise < 0.35)].str.replace(" ", "  ", regex=False)
+    names[(noise >= 0.35) & (noise < 0.45)] = names[(noise >= 0.35) & (noise < 0.45)] + " "
+    return pd.DataFrame({"Union Staff": names})
+
+
+def make_dataset(n_rows, seed=0, start="2023-01-01", days=730):
+    # All five workbooks for a BEER export of n_rows trips, keyed like app.FILES
+    sizes = population(n_rows)
+    beer = make_beer(n_rows, seed=seed, start=start, days=days)
+    return {
+        "passengers": make_people(sizes["passengers"], "passengers", seed=seed + 1, start=start, days=days),
+        "drivers": make_people(sizes["drivers"], "drivers", seed=seed + 2, start=start, days=days),
+        "beer": beer,
+        "transactions": make_transactions(beer, seed=seed + 3, shuffle=False),
+        "union_staff": make_union_staff(beer, seed=seed + 4),
+    }
+
+
+def make_trips(n_rows, seed=0, start="2023-01-01", days=730, n_locations=200):
+    # The trips table as preprocess_data leaves it (cleaned, sorted, categorical), without the UGX
+    # strings, so large benchmarks don't spend their time generating and cleaning text
+    rng = np.random.default_rng(seed)
+    n_drivers = max(n_rows // 50, 10)
+    n_passengers = max(n_rows // 5, 10)
+    pay = rng.choice([0, 2000, 2500, 3000, 5000, 7000], n_rows).astype(float)
+    # A town after the stage, so the locations fall into zones for the origin-destination matrix
+    locations = [f"Stage {i}, {TOWNS[i % len(TOWNS)]}" for i in range(n_locations)]
+    location_weights = zipf_weights(n_locations)
+
+    def categorical(codes, categories):
+        return pd.Categorical.from_codes(codes, categories=pd.Index(categories, dtype="str"))
+
+    return pd.DataFrame({
+        "Id": np.arange(1, n_rows + 1),
+        "Passenger": categorical(rng.integers(0, n_passengers, n_rows), [f"Passenger {i}" for i in range(n_passengers)]),
+        "Driver": categorical(rng.integers(0, n_drivers, n_rows), [f"Driver {i}" for i in range(n_drivers)]),
+        "Trip Date": trip_dates(n_rows, rng, start, days),
+        "Trip Distance (KM/Mi)": rng.gamma(2.0, 3.0, n_rows).round(2).astype("float32"),
+        "Trip Pay Amount": pay,
+        "Company Commission Cleaned": pay * 0.07,
+        "Trip Status": categorical(rng.choice(len(TRIP_STATUSES), n_rows, p=STATUS_WEIGHTS), TRIP_STATUSES),
+        "Pay Mode": categorical(rng.choice(len(PAY_MODES), n_rows, p=PAY_MODE_WEIGHTS), PAY_MODES),
+        "Pickup Location": categorical(rng.choice(n_locations, n_rows, p=location_weights), locations),
+        "Dropoff Location": categorical(rng.choice(n_locations, n_rows, p=location_weights), locations),
+    })
+
+
+def write_dataset(dataset, out_dir):
+    # Writes the workbooks under the names app.FILES expects, so the dashboard can run against them
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from app import FILES
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name, df in dataset.items():
+        if len(df) > XLSX_MAX_ROWS:
+            raise ValueError(f"{name} has {len(df):,} rows, more than an xlsx sheet holds")
+        df.to_excel(out_dir / FILES[name].name, index=False, engine="xlsxwriter")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic set of Union workbooks")
+    parser.add_argument("--rows", type=int, default=100_000, help="trips in BEER.xlsx")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, required=True)
+    args = parser.parse_args()
+    write_dataset(make_dataset(args.rows, seed=args.seed), args.out)
+
+
+if __name__ == "__main__":
+    main()
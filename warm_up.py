@@ -0,0 +1,44 @@
+# Deploy-time warm-up: cleans the workbooks into the parquet cache (and the trip store with
+# UNION_BACKEND=sqlite/duckdb) before the server takes traffic, so its first load reads the cache instead of
+# parsing Excel, and prints how long each step took. The "default view" step computes the KPIs of the first
+# page once as a timing check only: its results live in this process and are gone when it exits, each server
+# process warms its own KPI cache
+#   python warm_up.py --data-dir /srv/union && streamlit run app.py
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+started = time.perf_counter()
+import app  # noqa: E402
+import_seconds = time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Union data cache ahead of the first dashboard load")
+    parser.add_argument("--data-dir", type=Path, default=Path("."), help="directory holding the workbooks and .cache")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    # FILES and the cache directory are relative to the data directory, as for the dashboard
+    os.chdir(args.data_dir)
+    steps = {"import app": import_seconds}
+    step_started = time.perf_counter()
+    store = app.SnapshotStore()
+    steps["load data"] = time.perf_counter() - step_started
+    snapshot = store.current()
+    _, _, statuses = app.filter_options(snapshot)
+    if not statuses:
+        sys.exit("No trips loaded, nothing to warm up")
+    step_started = time.perf_counter()
+    store.warm()
+    steps["default view (timing only)"] = time.perf_counter() - step_started
+    for step, seconds in steps.items():
+        print(f"{step:<27} {seconds:7.2f}s")
+    print(f"{'total':<27} {sum(steps.values()):7.2f}s  (cache: {app.CACHE_DIR.resolve()})")
+
+
+if __name__ == "__main__":
+    main()